@@ -0,0 +1,135 @@
+import asyncio
+import os
+import secrets
+import signal
+import sys
+import time
+
+import aiohttp
+
+# --- クラスタランチャー ---
+# シャードを CLUSTER_COUNT 個のプロセスに分けて main.py を起動します。
+# 各クラスタの Web サーバーは PORT + CLUSTER_ID で待ち受け、/ipc/stats で統計を交換します。
+#
+#   DISCORD_TOKEN=... CLUSTER_COUNT=4 python cluster.py
+
+TOKEN = os.getenv("DISCORD_TOKEN")
+DATABASE_URL = os.getenv("DATABASE_URL") or ""
+CLUSTER_COUNT = int(os.getenv("CLUSTER_COUNT", os.cpu_count() or 1))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT")) if os.getenv("SHARD_COUNT") else None
+# IDENTIFY のレート制限 (5秒に1回) に引っかからないよう起動をずらす
+STARTUP_DELAY = float(os.getenv("CLUSTER_STARTUP_DELAY", 5.0))
+MAX_BACKOFF = float(os.getenv("CLUSTER_MAX_BACKOFF", 300.0))
+
+
+async def fetch_recommended_shards(token):
+    """Discord 推奨のシャード数を取得"""
+    headers = {"Authorization": f"Bot {token}"}
+    async with aiohttp.ClientSession() as session:
+        async with session.get("https://discord.com/api/v10/gateway/bot", headers=headers) as resp:
+            resp.raise_for_status()
+            data = await resp.json()
+            return data["shards"]
+
+
+def split_shards(shard_count, cluster_count):
+    """シャード0..N-1 を連続した範囲でクラスタに割り当てる"""
+    base, extra = divmod(shard_count, cluster_count)
+    ranges = []
+    start = 0
+    for i in range(cluster_count):
+        size = base + (1 if i < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return [r for r in ranges if r]
+
+
+class Cluster:
+    def __init__(self, cluster_id, shard_ids, env):
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+        self.env = env
+        self.process = None
+        self.backoff = 1.0
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(sys.executable, "main.py", env=self.env)
+        print(f"🚀 Cluster {self.cluster_id} 起動 (PID: {self.process.pid}, Shards: {self.shard_ids[0]}-{self.shard_ids[-1]})")
+
+    async def run(self, stopping):
+        """プロセスを監視し、落ちたらバックオフを挟んで再起動"""
+        while not stopping.is_set():
+            started = time.monotonic()
+            await self.start()
+            code = await self.process.wait()
+            if stopping.is_set():
+                break
+            # 長く動いていたならバックオフをリセット
+            if time.monotonic() - started > 60:
+                self.backoff = 1.0
+            print(f"⚠️ Cluster {self.cluster_id} が終了しました (code: {code})。{self.backoff:.0f}秒後に再起動します")
+            try:
+                await asyncio.wait_for(stopping.wait(), timeout=self.backoff)
+            except asyncio.TimeoutError:
+                pass
+            self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+
+    def signal(self, sig):
+        if self.process is not None and self.process.returncode is None:
+            self.process.send_signal(sig)
+
+
+async def main():
+    if not TOKEN:
+        print("❌ エラー: DISCORD_TOKEN が設定されていません。")
+        return 1
+
+    if DATABASE_URL.startswith("sqlite:") and CLUSTER_COUNT > 1:
+        print("❌ SQLite バックエンドは単一プロセス専用です (CLUSTER_COUNT=1 にするか PostgreSQL を使用してください)")
+        return 1
+
+    shard_count = SHARD_COUNT or await fetch_recommended_shards(TOKEN)
+    assignments = split_shards(shard_count, CLUSTER_COUNT)
+    secret = os.getenv("IPC_SECRET") or secrets.token_hex(16)
+    print(f"✅ シャード数: {shard_count} / クラスタ数: {len(assignments)}")
+
+    clusters = []
+    for cluster_id, shard_ids in enumerate(assignments):
+        env = dict(os.environ)
+        env.update({
+            "CLUSTER_ID": str(cluster_id),
+            "CLUSTER_COUNT": str(len(assignments)),
+            "SHARD_COUNT": str(shard_count),
+            "SHARD_IDS": ",".join(map(str, shard_ids)),
+            "IPC_SECRET": secret,
+        })
+        clusters.append(Cluster(cluster_id, shard_ids, env))
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    def shutdown(sig):
+        print(f"🛑 {sig.name} を受信しました。全クラスタを停止します")
+        stopping.set()
+        for cluster in clusters:
+            cluster.signal(sig)
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, shutdown, sig)
+        except NotImplementedError:
+            pass
+
+    tasks = []
+    for cluster in clusters:
+        tasks.append(asyncio.create_task(cluster.run(stopping)))
+        if stopping.is_set():
+            break
+        await asyncio.sleep(STARTUP_DELAY * len(cluster.shard_ids))
+
+    await asyncio.gather(*tasks)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
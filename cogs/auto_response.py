@@ -0,0 +1,91 @@
+import discord
+from discord import app_commands
+from discord.ext import commands
+import os
+from utils.auto_responses import validate_regex
+from utils.constants import COLOR_MAIN
+
+# サーバーあたりのトリガー上限と、正規表現パターンの最大長
+AUTO_RESPONSE_LIMIT = int(os.getenv("AUTO_RESPONSE_LIMIT", 5000))
+AUTO_RESPONSE_PATTERN_MAX = 200
+# 正規表現はメッセージごとにイベントループ上で全件を試すため、件数を別に絞る
+AUTO_RESPONSE_REGEX_LIMIT = int(os.getenv("AUTO_RESPONSE_REGEX_LIMIT", 20))
+
+MATCH_TYPE_NAMES = {"exact": "完全一致", "prefix": "前方一致", "regex": "正規表現"}
+
+
+class AutoResponse(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+
+    ar_group = app_commands.Group(name="autoresponse", description="自動応答の設定")
+
+    @ar_group.command(name="add", description="自動応答を追加します")
+    @app_commands.describe(trigger="反応する言葉 (正規表現の場合はパターン)", response="返信する内容", match_type="マッチ方式")
+    @app_commands.choices(match_type=[
+        app_commands.Choice(name="完全一致", value="exact"),
+        app_commands.Choice(name="前方一致", value="prefix"),
+        app_commands.Choice(name="正規表現", value="regex"),
+    ])
+    @app_commands.checks.has_permissions(manage_guild=True)
+    async def add(self, interaction: discord.Interaction, trigger: str, response: str, match_type: str = "exact"):
+        if not trigger.strip():
+            return await interaction.response.send_message("❌ トリガーが空です。", ephemeral=True)
+        if match_type == "regex":
+            if len(trigger) > AUTO_RESPONSE_PATTERN_MAX:
+                return await interaction.response.send_message(f"❌ 正規表現は{AUTO_RESPONSE_PATTERN_MAX}文字以内にしてください。", ephemeral=True)
+            error = validate_regex(trigger)
+            if error is not None:
+                return await interaction.response.send_message(f"❌ {error}", ephemeral=True)
+
+        cache = self.bot.db.auto_responses
+        index = await cache.get(interaction.guild.id)
+        if len(index) >= AUTO_RESPONSE_LIMIT:
+            return await interaction.response.send_message(f"❌ 自動応答は{AUTO_RESPONSE_LIMIT}件までです。", ephemeral=True)
+        if match_type == "regex" and index.regex_count >= AUTO_RESPONSE_REGEX_LIMIT:
+            return await interaction.response.send_message(f"❌ 正規表現の自動応答は{AUTO_RESPONSE_REGEX_LIMIT}件までです。", ephemeral=True)
+
+        row = await cache.add(interaction.guild.id, trigger, response, match_type, interaction.user.id)
+        await interaction.response.send_message(f"✅ 自動応答を追加しました (ID: {row['id']} / {MATCH_TYPE_NAMES[match_type]}): `{trigger}` → {response}")
+
+    @ar_group.command(name="remove", description="自動応答を削除します")
+    @app_commands.describe(response_id="/autoresponse list で表示されるID")
+    @app_commands.checks.has_permissions(manage_guild=True)
+    async def remove(self, interaction: discord.Interaction, response_id: int):
+        row = await self.bot.db.auto_responses.remove(interaction.guild.id, response_id)
+        if row is None:
+            return await interaction.response.send_message("❌ そのIDの自動応答はありません。", ephemeral=True)
+        await interaction.response.send_message(f"🗑️ 自動応答 (ID: {response_id}) を削除しました。")
+
+    @ar_group.command(name="list", description="自動応答の一覧を表示します")
+    async def list_responses(self, interaction: discord.Interaction, page: int = 1):
+        index = await self.bot.db.auto_responses.get(interaction.guild.id)
+        rows = list(index.rows.values())
+        if not rows:
+            return await interaction.response.send_message("📭 自動応答は登録されていません。", ephemeral=True)
+
+        per_page = 15
+        pages = (len(rows) - 1) // per_page + 1
+        page = max(1, min(page, pages))
+        lines = [
+            f"`{row['id']}` [{MATCH_TYPE_NAMES.get(row['match_type'], row['match_type'])}] `{row['trigger'][:50]}` → {row['response'][:50]}"
+            for row in rows[(page - 1) * per_page:page * per_page]
+        ]
+        embed = discord.Embed(title="💬 自動応答一覧", description="\n".join(lines), color=COLOR_MAIN)
+        embed.set_footer(text=f"{page}/{pages} ページ (全{len(rows)}件)")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        if message.author.bot or not message.guild or not message.content:
+            return
+        # 索引はメモリ上 (サーバーごとに初回のみDBから読み込み)
+        index = await self.bot.db.auto_responses.get(message.guild.id)
+        if not index:
+            return
+        row = index.match(message.content)
+        if row is not None:
+            await message.channel.send(row['response'], allowed_mentions=discord.AllowedMentions.none())
+
+async def setup(bot):
+    await bot.add_cog(AutoResponse(bot))
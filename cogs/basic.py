@@ -33,9 +33,10 @@ class Basic(commands.Cog):
             "━━━━━━━━━━━━━━━━━━━━━━"
         )
         
-        # 統計情報
-        server_count = len(self.bot.guilds)
-        member_count = sum(g.member_count for g in self.bot.guilds)
+        # 統計情報 (クラスタ構成では全クラスタの合計)
+        totals = await self.bot.ipc.totals()
+        server_count = totals['guilds']
+        member_count = totals['members']
         command_count = len(self.bot.tree.get_commands())
         
         # 稼働時間
@@ -3,10 +3,20 @@ from discord import app_commands
 from discord.ext import commands
 import random
 from utils.constants import JOBS, COLOR_MAIN, COLOR_ERROR, COLOR_SUCCESS
+from utils.cooldowns import cooldown
+from utils.leaderboard import Leaderboard
 
 class Economy(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # 純資産ランキング (上位100件をバックグラウンドで定期更新)
+        self.leaderboard = Leaderboard(bot)
+
+    async def cog_load(self):
+        self.leaderboard.start()
+
+    async def cog_unload(self):
+        self.leaderboard.stop()
 
     async def get_balance_data(self, user_id):
         """ユーザーデータを取得。なければ作成"""
@@ -37,6 +47,7 @@ class Economy(commands.Cog):
         await interaction.followup.send(embed=embed)
 
     @s_group.command(name="work", description="仕事をしてお金を稼ぎます")
+    @cooldown(1, 600, column="last_work")
     async def work(self, interaction: discord.Interaction):
         await interaction.response.defer()
         user_id = interaction.user.id
@@ -59,7 +70,7 @@ class Economy(commands.Cog):
         else:
             earnings = int(base_salary * variance * multiplier)
 
-        await self.bot.db.update_money(user_id, cash=earnings)
+        await self.bot.db.update_money(user_id, cash=earnings, source="work", guild_id=interaction.guild_id)
         
         embed = discord.Embed(title="👔 お仕事完了！", description=f"**{job_name}** として働きました。", color=COLOR_SUCCESS)
         embed.add_field(name="給料", value=f"¥{earnings:,}", inline=True)
@@ -68,15 +79,13 @@ class Economy(commands.Cog):
 
     @s_group.command(name="slot", description="スロットでお金を増やします (賭け金指定)")
     @app_commands.describe(bet="賭ける金額")
+    @cooldown(5, 10)
     async def slot(self, interaction: discord.Interaction, bet: int):
         await interaction.response.defer()
         user_id = interaction.user.id
-        data = await self.get_balance_data(user_id)
 
         if bet < 100:
             return await interaction.followup.send("❌ 最低賭け金は ¥100 です。", ephemeral=True)
-        if data['cash'] < bet:
-            return await interaction.followup.send("❌ 現金が足りません！", ephemeral=True)
 
         # 絵柄定義
         emojis = ["🍒", "🍋", "🍇", "🍉", "🔔", "💎", "7️⃣"]
@@ -98,14 +107,16 @@ class Economy(commands.Cog):
         elif result[0] == result[1] or result[1] == result[2] or result[0] == result[2]: # 2つ揃い
             win_amt = int(bet * 1.5)
 
-        # DB更新
+        # DB更新 (残高チェックと増減を1文で行う)
+        delta = win_amt if win_amt > 0 else -bet
+        row = await self.bot.db.update_money_if(user_id, cash=delta, min_cash=bet, source="slot", guild_id=interaction.guild_id)
+        if row is None:
+            return await interaction.followup.send("❌ 現金が足りません！", ephemeral=True)
+
         if win_amt > 0:
-            profit = win_amt
-            await self.bot.db.update_money(user_id, cash=profit)
-            msg = f"🎉 **大当たり！** ¥{profit:,} 獲得！"
+            msg = f"🎉 **大当たり！** ¥{win_amt:,} 獲得！"
             color = COLOR_SUCCESS
         else:
-            await self.bot.db.update_money(user_id, cash=-bet)
             msg = "💀 **ハズレ...** お金が吸い込まれました。"
             color = COLOR_ERROR
 
@@ -120,14 +131,13 @@ class Economy(commands.Cog):
             return await interaction.followup.send("❌ 1円以上指定してください。", ephemeral=True)
         if to_user.bot:
             return await interaction.followup.send("❌ Botには送金できません。", ephemeral=True)
-        
-        sender_data = await self.get_balance_data(interaction.user.id)
-        if sender_data['cash'] < amount:
-            return await interaction.followup.send("❌ 現金が足りません。", ephemeral=True)
+        if to_user.id == interaction.user.id:
+            return await interaction.followup.send("❌ 自分自身には送金できません。", ephemeral=True)
 
-        # トランザクション的に処理 (簡易実装)
-        await self.bot.db.update_money(interaction.user.id, cash=-amount)
-        await self.bot.db.update_money(to_user.id, cash=amount)
+        # 残高チェック・出金・入金を1トランザクションで処理
+        row = await self.bot.db.transfer(interaction.user.id, to_user.id, amount, guild_id=interaction.guild_id)
+        if row is None:
+            return await interaction.followup.send("❌ 現金が足りません。", ephemeral=True)
 
         embed = discord.Embed(description=f"💸 {to_user.mention} に ¥{amount:,} 送金しました。", color=COLOR_SUCCESS)
         await interaction.followup.send(embed=embed)
@@ -139,13 +149,13 @@ class Economy(commands.Cog):
         
         # 借金上限チェック (例: 1000万まで)
         limit = 10000000
-        data = await self.get_balance_data(interaction.user.id)
-        if data['debt'] + amount > limit:
+
+        # 現金と借金を増やす (上限チェックと同時に行う)
+        row = await self.bot.db.update_money_if(interaction.user.id, cash=amount, debt=amount, max_debt=limit, source="borrow", guild_id=interaction.guild_id)
+        if row is None:
              return await interaction.followup.send(f"❌ 借金限度額を超えています (上限: ¥{limit:,})", ephemeral=True)
 
-        # 現金と借金を増やす
-        await self.bot.db.update_money(interaction.user.id, cash=amount, debt=amount)
-        await interaction.followup.send(f"💳 ¥{amount:,} 借りました。ご利用は計画的に！ (現在の借金: ¥{data['debt'] + amount:,})")
+        await interaction.followup.send(f"💳 ¥{amount:,} 借りました。ご利用は計画的に！ (現在の借金: ¥{row['debt']:,})")
 
     @s_group.command(name="repay", description="借金を返済します")
     async def repay(self, interaction: discord.Interaction, amount: int):
@@ -153,47 +163,54 @@ class Economy(commands.Cog):
         if amount <= 0: return await interaction.followup.send("❌ 1円以上指定してください。", ephemeral=True)
         
         user_id = interaction.user.id
-        data = await self.get_balance_data(user_id)
-        
-        if data['debt'] <= 0:
-            return await interaction.followup.send("✅ 借金はありません！", ephemeral=True)
-        if data['cash'] < amount:
+
+        # 現金と借金を減らす (返済額が借金より多い場合は借金の額だけ返す)
+        row = await self.bot.db.repay_debt(user_id, amount, guild_id=interaction.guild_id)
+        if row is None:
+            # 失敗時のみ理由を確認
+            data = await self.get_balance_data(user_id)
+            if data['debt'] <= 0:
+                return await interaction.followup.send("✅ 借金はありません！", ephemeral=True)
             return await interaction.followup.send("❌ 現金が足りません。", ephemeral=True)
-        
-        # 返済額が借金より多い場合は借金の額だけ返す
-        pay_amount = min(amount, data['debt'])
-        
-        # 現金と借金を減らす
-        await self.bot.db.update_money(user_id, cash=-pay_amount, debt=-pay_amount)
-        
-        remaining_debt = data['debt'] - pay_amount
-        await interaction.followup.send(f"💸 借金を ¥{pay_amount:,} 返済しました！ (残り: ¥{remaining_debt:,})")
+
+        await interaction.followup.send(f"💸 借金を ¥{row['paid']:,} 返済しました！ (残り: ¥{row['debt']:,})")
 
     @s_group.command(name="ranking", description="所持金ランキングを表示")
-    async def ranking(self, interaction: discord.Interaction):
+    @app_commands.describe(page="ページ番号 (1ページ10人)")
+    async def ranking(self, interaction: discord.Interaction, page: int = 1):
         await interaction.response.defer()
-        # 純資産 (現金+銀行-借金) でソート
-        query = """
-            SELECT user_id, (cash + bank - debt) as net_worth 
-            FROM users 
-            ORDER BY net_worth DESC 
-            LIMIT 10
-        """
-        rows = await self.bot.db.fetch(query)
-        
+        page = max(page, 1)
+        # 純資産 (現金+銀行-借金) でソート済みのキャッシュから取得
+        rows = await self.leaderboard.page(page)
+        names = await self.leaderboard.resolve_names([user_id for _, user_id, _ in rows])
+
         embed = discord.Embed(title="🏆 億万長者ランキング", color=0xFFD700)
         text = ""
-        for i, row in enumerate(rows, 1):
-            user = self.bot.get_user(row['user_id'])
-            # ユーザーが見つからない場合はID表示 (キャッシュにない場合があるため)
-            name = user.display_name if user else f"User ID: {row['user_id']}"
-            
-            medal = "🥇" if i==1 else "🥈" if i==2 else "🥉" if i==3 else f"{i}."
-            text += f"**{medal} {name}**: ¥{row['net_worth']:,}\n"
+        for rank, user_id, net_worth in rows:
+            medal = "🥇" if rank==1 else "🥈" if rank==2 else "🥉" if rank==3 else f"{rank}."
+            text += f"**{medal} {names[user_id]}**: ¥{net_worth:,}\n"
         
         embed.description = text if text else "まだデータがありません。"
+        embed.set_footer(text=f"ページ {page}")
         await interaction.followup.send(embed=embed)
 
+    @s_group.command(name="history", description="お金の出入りの履歴を表示")
+    async def history(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+        rows = await self.bot.db.ledger.history(interaction.user.id, limit=10)
+
+        embed = discord.Embed(title="📒 取引履歴 (直近10件)", color=COLOR_MAIN)
+        text = ""
+        for row in rows:
+            sign = "+" if row['cash'] >= 0 else "-"
+            when = row['created_at'].strftime('%m/%d %H:%M')
+            text += f"`{when}` **{row['source']}** {sign}¥{abs(row['cash']):,}"
+            if row['debt']:
+                text += f" (借金 {row['debt']:+,})"
+            text += "\n"
+        embed.description = text if text else "まだ履歴がありません。"
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
     @s_group.command(name="info", description="今日のスロット情報を表示")
     async def slot_info(self, interaction: discord.Interaction):
         # 演出用
@@ -212,13 +229,10 @@ class Economy(commands.Cog):
         
         target_job = JOBS[job_name]
         cost = target_job['cost']
-        user_data = await self.get_balance_data(interaction.user.id)
-        
-        if user_data['cash'] < cost:
+
+        row = await self.bot.db.change_job(interaction.user.id, job_name, cost, guild_id=interaction.guild_id)
+        if row is None:
             return await interaction.followup.send(f"❌ 転職費用 ¥{cost:,} が足りません。", ephemeral=True)
-            
-        await self.bot.db.update_money(interaction.user.id, cash=-cost)
-        await self.bot.db.execute("UPDATE users SET job = $1 WHERE user_id = $2", job_name, interaction.user.id)
         
         await interaction.followup.send(f"🎉 おめでとうございます！ **{job_name}** に転職しました！\n給料倍率: {target_job['multiplier']}倍")
 
@@ -4,10 +4,27 @@ from discord.ext import commands
 import random
 import asyncio
 from utils.constants import COLOR_MAIN, QUESTS, OMIKUJI_RESULTS
+from utils.cooldowns import cooldown
+from utils.game_sessions import GameSessions, SessionBusy
 
 class Games(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # 回答待ち {(channel_id, user_id): 待機中のゲーム} (1ユーザー1ゲームまで)
+        self.sessions = GameSessions()
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        if message.author.bot:
+            return
+        self.sessions.dispatch(message)
+
+    async def busy(self, interaction):
+        """進行中のゲームがあれば通知して True"""
+        if self.sessions.is_active(interaction.user.id):
+            await interaction.response.send_message("⏳ 進行中のゲームがあります。先にそちらに回答してください。", ephemeral=True)
+            return True
+        return False
 
     game_group = app_commands.Group(name="game", description="ミニゲーム集")
 
@@ -29,6 +46,7 @@ class Games(commands.Cog):
 
     # --- 2. Emerald (宝探し) ---
     @game_group.command(name="emerald", description="エメラルドを探します")
+    @cooldown(1, 30)
     async def emerald(self, interaction: discord.Interaction):
         # 3つの箱から1つ選ぶイメージ
         result = random.choices(["ハズレ", "エメラルド", "ダイヤモンド"], weights=[60, 30, 10], k=1)[0]
@@ -38,12 +56,12 @@ class Games(commands.Cog):
             color = 0x95a5a6
         elif result == "エメラルド":
             amt = random.randint(500, 1000)
-            await self.bot.db.update_money(interaction.user.id, cash=amt)
+            await self.bot.db.update_money(interaction.user.id, cash=amt, source="emerald", guild_id=interaction.guild_id)
             msg = f"🟢 **エメラルド発見！** ¥{amt:,} で売れました！"
             color = 0x2ecc71
         else:
             amt = random.randint(2000, 5000)
-            await self.bot.db.update_money(interaction.user.id, cash=amt)
+            await self.bot.db.update_money(interaction.user.id, cash=amt, source="emerald", guild_id=interaction.guild_id)
             msg = f"💎 **ダイヤモンド発見！** ¥{amt:,} の大金です！"
             color = 0x3498db
             
@@ -61,42 +79,50 @@ class Games(commands.Cog):
         expr = f"{a} {op} {b}"
         answer = eval(expr)
         
+        if await self.busy(interaction):
+            return
         await interaction.response.send_message(f"🧠 **問題**: `{expr} = ?` (10秒以内に数字のみ入力)")
         
         def check(m):
-            return m.author == interaction.user and m.channel == interaction.channel and m.content.isdigit()
+            return m.content.lstrip('-').isdigit()
 
         try:
-            msg = await self.bot.wait_for('message', check=check, timeout=10.0)
+            msg = await self.sessions.wait(interaction.channel_id, interaction.user.id, check=check, timeout=10.0)
             if int(msg.content) == answer:
                 # 正解報酬
                 reward = 300
-                await self.bot.db.update_money(interaction.user.id, cash=reward)
+                await self.bot.db.update_money(interaction.user.id, cash=reward, source="math_quiz", guild_id=interaction.guild_id)
                 await msg.reply(f"⭕ **正解！** 報酬: ¥{reward}")
             else:
                 await msg.reply(f"❌ **不正解...** 答えは `{answer}` でした。")
         except asyncio.TimeoutError:
             await interaction.followup.send(f"⏰ 時間切れ！ 答えは `{answer}` でした。")
+        except SessionBusy:
+            await interaction.followup.send("⏳ 進行中のゲームがあります。", ephemeral=True)
 
     # --- 4. Guess (数当て) ---
     @game_group.command(name="guess", description="1〜10の数字を当ててください")
     async def guess(self, interaction: discord.Interaction):
         target = random.randint(1, 10)
+        if await self.busy(interaction):
+            return
         await interaction.response.send_message("🔢 1から10の数字を思い浮かべました。何でしょう？ (1回勝負)")
         
         def check(m):
-            return m.author == interaction.user and m.channel == interaction.channel and m.content.isdigit()
+            return m.content.isdigit()
 
         try:
-            msg = await self.bot.wait_for('message', check=check, timeout=10.0)
+            msg = await self.sessions.wait(interaction.channel_id, interaction.user.id, check=check, timeout=10.0)
             val = int(msg.content)
             if val == target:
-                await self.bot.db.update_money(interaction.user.id, cash=500)
+                await self.bot.db.update_money(interaction.user.id, cash=500, source="guess", guild_id=interaction.guild_id)
                 await msg.reply("🎯 **大当たり！** ¥500 ゲット！")
             else:
                 await msg.reply(f"💨 ハズレ... 正解は `{target}` でした。")
         except asyncio.TimeoutError:
             await interaction.followup.send(f"⏰ 時間切れ！ 正解は `{target}` でした。")
+        except SessionBusy:
+            await interaction.followup.send("⏳ 進行中のゲームがあります。", ephemeral=True)
 
     # --- 5. Love Calc (恋愛計算) ---
     @game_group.command(name="lovecalc", description="二人の相性を計算します")
@@ -132,15 +158,14 @@ class Games(commands.Cog):
         bot_words = ["りんご", "ごりら", "らっぱ", "ぱんだ", "だちょう", "うし", "しか", "からす", "すいか"]
         start_word = random.choice(bot_words)
         
+        if await self.busy(interaction):
+            return
         await interaction.response.send_message(f"しりとりスタート！ Bot: **{start_word}**\n（「{start_word[-1]}」から始まる単語をひらがなで入力してね！）")
         
         target_char = start_word[-1]
         
-        def check(m):
-            return m.author == interaction.user and m.channel == interaction.channel
-            
         try:
-            msg = await self.bot.wait_for('message', check=check, timeout=20.0)
+            msg = await self.sessions.wait(interaction.channel_id, interaction.user.id, timeout=20.0)
             content = msg.content
             
             # 簡易チェック: 最後の文字が合っているか、"ん"で終わっていないか
@@ -152,10 +177,12 @@ class Games(commands.Cog):
                 # Botは適当に返して終わる (無限ループ防止のため簡易版)
                 end_word = "ん" # Botが負ける演出
                 await msg.reply(f"Bot: **{random.choice(['みかん', 'きりん', 'ラーメン'])}**... あっ！「ん」がついちゃった！\n🎉 あなたの勝ちです！")
-                await self.bot.db.update_money(interaction.user.id, cash=100)
+                await self.bot.db.update_money(interaction.user.id, cash=100, source="shiritori", guild_id=interaction.guild_id)
                 
         except asyncio.TimeoutError:
             await interaction.followup.send("⏰ 時間切れです！")
+        except SessionBusy:
+            await interaction.followup.send("⏳ 進行中のゲームがあります。", ephemeral=True)
 
 # --- Quest用 View (ボタン処理) ---
 class QuestView(discord.ui.View):
@@ -173,7 +200,7 @@ class QuestView(discord.ui.View):
         # 結果判定
         if random.randint(1, 100) <= self.quest['success_rate']:
             reward = random.randint(self.quest['reward_min'], self.quest['reward_max'])
-            await self.bot.db.update_money(self.user_id, cash=reward)
+            await self.bot.db.update_money(self.user_id, cash=reward, source="bot_quest", guild_id=interaction.guild_id)
             
             embed = discord.Embed(title="🎉 クエスト成功！", color=COLOR_MAIN)
             embed.description = f"無事に{self.quest['name']}を達成しました。\n報酬: **¥{reward:,}** 獲得！"
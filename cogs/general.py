@@ -14,6 +14,9 @@ class General(commands.Cog):
     @app_commands.command(name="serverinfo", description="サーバーの詳細情報を表示します")
     async def serverinfo(self, interaction: discord.Interaction):
         guild = interaction.guild
+        # メンバーがキャッシュされていない場合 (CACHE_PROFILE=lean) はAPIの概算値を使う
+        if not guild.chunked:
+            await interaction.response.defer()
         embed = discord.Embed(title=f"🏰 {guild.name} の情報", color=COLOR_MAIN)
         
         if guild.icon:
@@ -22,15 +25,21 @@ class General(commands.Cog):
             embed.set_image(url=guild.banner.url)
 
         # メンバー内訳
-        humans = len([m for m in guild.members if not m.bot])
-        bots = len([m for m in guild.members if m.bot])
-        online = len([m for m in guild.members if m.status != discord.Status.offline])
+        if guild.chunked:
+            humans = len([m for m in guild.members if not m.bot])
+            bots = len([m for m in guild.members if m.bot])
+            online = len([m for m in guild.members if m.status != discord.Status.offline])
+            member_text = f"合計: {guild.member_count}\n(人: {humans} / Bot: {bots})"
+        else:
+            counts = await self.bot.fetch_guild(guild.id, with_counts=True)
+            online = counts.approximate_presence_count
+            member_text = f"合計: {guild.member_count or counts.approximate_member_count}"
 
         embed.add_field(name="🆔 サーバーID", value=guild.id, inline=True)
-        embed.add_field(name="👑 オーナー", value=guild.owner.mention, inline=True)
+        embed.add_field(name="👑 オーナー", value=f"<@{guild.owner_id}>", inline=True)
         embed.add_field(name="📅 作成日", value=guild.created_at.strftime('%Y/%m/%d'), inline=True)
         
-        embed.add_field(name="👥 メンバー", value=f"合計: {guild.member_count}\n(人: {humans} / Bot: {bots})", inline=True)
+        embed.add_field(name="👥 メンバー", value=member_text, inline=True)
         embed.add_field(name="🟢 アクティブ", value=f"{online} 人", inline=True)
         embed.add_field(name="🛡️ セキュリティ", value=str(guild.verification_level).title(), inline=True)
         
@@ -38,11 +47,17 @@ class General(commands.Cog):
         embed.add_field(name="🎭 ロール数", value=len(guild.roles), inline=True)
         embed.add_field(name="🚀 ブースト", value=f"Level {guild.premium_tier} ({guild.premium_subscription_count} Boosts)", inline=True)
 
-        await interaction.response.send_message(embed=embed)
+        if interaction.response.is_done():
+            await interaction.followup.send(embed=embed)
+        else:
+            await interaction.response.send_message(embed=embed)
 
     @app_commands.command(name="userinfo", description="ユーザーの詳細情報を表示します")
     async def userinfo(self, interaction: discord.Interaction, member: discord.Member = None):
         target = member or interaction.user
+        # メンバーキャッシュが無い場合に参加日などが欠けていれば取得し直す
+        if target.joined_at is None:
+            target = await interaction.guild.fetch_member(target.id)
         
         roles = [role.mention for role in target.roles if role.name != "@everyone"]
         roles.reverse() # 上位ロールから表示
@@ -2,18 +2,46 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 import datetime
+import os
 import re
-from collections import defaultdict, deque
+from collections import defaultdict
 from utils.constants import COLOR_ERROR, COLOR_WARN, COLOR_SUCCESS
+from utils.mod_log import ModLogDispatcher
+from utils.rate_window import RateWindow
+from utils.word_filter import compile_bad_words
+
+# 警告のエスカレーション (N件目でタイムアウト / キック。0で無効)
+WARN_TIMEOUT_AT = int(os.getenv("WARN_TIMEOUT_AT", 3))
+WARN_TIMEOUT_MINUTES = int(os.getenv("WARN_TIMEOUT_MINUTES", 60))
+WARN_KICK_AT = int(os.getenv("WARN_KICK_AT", 5))
+WARN_PAGE_SIZE = 10
 
 class Moderation(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        # スパム検知用キャッシュ {guild_id: {user_id: deque([timestamp, ...])}}
-        self.spam_check = defaultdict(lambda: defaultdict(lambda: deque(maxlen=10)))
+        # 連投検知 {(guild_id, user_id): 直近の発言時刻} (しばらく発言のないユーザーは自動で破棄)
+        self.spam_detector = RateWindow(idle_ttl=float(os.getenv("SPAM_IDLE_TTL", 60)))
+        # automod_config が無いサーバーの閾値 (window 秒以内に limit 件) とタイムアウト秒数
+        self.spam_limit = int(os.getenv("SPAM_LIMIT", 5))
+        self.spam_window = float(os.getenv("SPAM_WINDOW", 5))
+        self.spam_mute = int(os.getenv("SPAM_MUTE_SECONDS", 60))
+        # ログ送信キュー (10件ずつまとめて送信。MODLOG_WEBHOOK=1 で Webhook 経由、サーバー間は並行送信)
+        self.mod_log = ModLogDispatcher(
+            bot,
+            flush_interval=float(os.getenv("MODLOG_FLUSH_INTERVAL", 2)),
+            max_queue=int(os.getenv("MODLOG_MAX_QUEUE", 200)),
+            use_webhook=os.getenv("MODLOG_WEBHOOK", "0") == "1",
+            concurrency=int(os.getenv("MODLOG_CONCURRENCY", 8)),
+        )
         # ホワイトリストキャッシュ {guild_id: [user_ids]}
         self.whitelists = defaultdict(list)
 
+    async def cog_load(self):
+        self.mod_log.start()
+
+    async def cog_unload(self):
+        await self.mod_log.close()
+
     # --- 🛡️ 基本処罰コマンド ---
 
     @app_commands.command(name="kick", description="ユーザーをサーバーからキックします")
@@ -74,15 +102,65 @@ class Moderation(commands.Cog):
         await interaction.followup.send(f"🗑️ {len(deleted)}件のメッセージを削除しました。", ephemeral=True)
         await self.log_action(interaction.guild, "メッセージ削除", f"チャンネル: {interaction.channel.mention}\n件数: {len(deleted)}\n実行者: {interaction.user}", COLOR_WARN)
 
+    # --- ⚠️ 警告 ---
+
+    warn_group = app_commands.Group(name="warn", description="警告の管理")
+
+    async def warn_member(self, guild, member, moderator, reason):
+        """警告を記録し、件数に応じてタイムアウト/キック。(件数, 実行した処罰) を返す"""
+        _, count = await self.bot.db.warnings.add(guild.id, member.id, reason, moderator.id)
+        action = None
+        try:
+            if WARN_KICK_AT and count >= WARN_KICK_AT:
+                await member.kick(reason=f"警告{count}件: {reason}")
+                action = "キック"
+            elif WARN_TIMEOUT_AT and count >= WARN_TIMEOUT_AT:
+                await member.timeout(datetime.timedelta(minutes=WARN_TIMEOUT_MINUTES), reason=f"警告{count}件: {reason}")
+                action = f"{WARN_TIMEOUT_MINUTES}分タイムアウト"
+        except discord.HTTPException:
+            pass
+        details = f"対象: {member}\n実行者: {moderator}\n理由: {reason}\n累計: {count}件"
+        if action:
+            details += f"\n自動処罰: {action}"
+        await self.log_action(guild, "警告", details, COLOR_WARN)
+        return count, action
+
+    @warn_group.command(name="add", description="ユーザーに警告を与えます")
+    @app_commands.checks.has_permissions(moderate_members=True)
+    async def warn_add(self, interaction: discord.Interaction, member: discord.Member, reason: str = "理由なし"):
+        if member.bot:
+            return await interaction.response.send_message("❌ Botには警告できません。", ephemeral=True)
+        if member.top_role >= interaction.user.top_role:
+            return await interaction.response.send_message("❌ 上位メンバーには警告できません。", ephemeral=True)
+
+        await interaction.response.defer()
+        count, action = await self.warn_member(interaction.guild, member, interaction.user, reason)
+        msg = f"⚠️ **{member}** に警告しました。(累計 {count}件)\n理由: {reason}"
+        if action:
+            msg += f"\n🚨 自動処罰: {action}"
+        await interaction.followup.send(msg)
+
+    @warn_group.command(name="list", description="ユーザーの警告履歴を表示します")
+    @app_commands.checks.has_permissions(moderate_members=True)
+    async def warn_list(self, interaction: discord.Interaction, member: discord.Member):
+        await interaction.response.defer(ephemeral=True)
+        view = WarningsView(self.bot, interaction.user.id, interaction.guild.id, member)
+        await view.load()
+        await interaction.followup.send(embed=view.embed(), view=view, ephemeral=True)
+
+    @warn_group.command(name="clear", description="ユーザーの警告を全て削除します")
+    @app_commands.checks.has_permissions(moderate_members=True)
+    async def warn_clear(self, interaction: discord.Interaction, member: discord.Member):
+        deleted = await self.bot.db.warnings.clear(interaction.guild.id, member.id)
+        await interaction.response.send_message(f"🧹 **{member}** の警告を {deleted}件 削除しました。")
+        await self.log_action(interaction.guild, "警告削除", f"対象: {member}\n実行者: {interaction.user}\n件数: {deleted}", COLOR_SUCCESS)
+
     # --- ⚙️ 設定コマンド (ログ・AutoMod) ---
 
     @app_commands.command(name="logs_setting", description="ログチャンネルを設定します")
     @app_commands.checks.has_permissions(administrator=True)
     async def logs_setting(self, interaction: discord.Interaction, channel: discord.TextChannel):
-        await self.bot.db.execute(
-            "INSERT INTO guild_settings (guild_id, log_channel_id) VALUES ($1, $2) ON CONFLICT (guild_id) DO UPDATE SET log_channel_id = $2",
-            interaction.guild.id, channel.id
-        )
+        await self.bot.db.guild_settings.update("guild_settings.set_log_channel", interaction.guild.id, channel.id)
         await interaction.response.send_message(f"✅ ログチャンネルを {channel.mention} に設定しました。")
 
     @app_commands.command(name="automod_setting", description="AutoMod(荒らし対策)の設定")
@@ -94,24 +172,52 @@ class Moderation(commands.Cog):
     @app_commands.checks.has_permissions(administrator=True)
     async def automod_setting(self, interaction: discord.Interaction, feature: str, enabled: bool, content: str = None):
         if feature == "bad_words":
-            await self.bot.db.execute(
-                "INSERT INTO guild_settings (guild_id, bad_words) VALUES ($1, $2) ON CONFLICT (guild_id) DO UPDATE SET bad_words = $2",
-                interaction.guild.id, content or ""
-            )
-            # 有効化フラグは別途管理しても良いが、ここでは単語があるかないかで判定簡易化も可。
-            # 今回は明示的な有効化フラグも更新
-            await self.bot.db.execute("UPDATE guild_settings SET automod_enabled = $1 WHERE guild_id = $2", enabled, interaction.guild.id)
+            # 禁止用語と明示的な有効化フラグを同時に更新
+            await self.bot.db.guild_settings.update("guild_settings.set_bad_words", interaction.guild.id, content or "", enabled)
             msg = f"禁止用語を更新: {content}" if content else "禁止用語設定を変更"
             
         elif feature == "spam":
-            await self.bot.db.execute(
-                "INSERT INTO guild_settings (guild_id, spam_filter_enabled) VALUES ($1, $2) ON CONFLICT (guild_id) DO UPDATE SET spam_filter_enabled = $2",
-                interaction.guild.id, enabled
-            )
+            await self.bot.db.guild_settings.update("guild_settings.set_spam_filter", interaction.guild.id, enabled)
             msg = "スパムフィルターを有効化" if enabled else "スパムフィルターを無効化"
 
         await interaction.response.send_message(f"🛡️ **AutoMod設定**: {msg}")
 
+    @app_commands.command(name="automod_config", description="連投検知の閾値とタイムアウト時間を設定します")
+    @app_commands.describe(spam_threshold="連投とみなす件数 (一定秒数内)", mute_duration="連投時のタイムアウト秒数")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def automod_config(self, interaction: discord.Interaction, spam_threshold: app_commands.Range[int, 2, 50] = None, mute_duration: app_commands.Range[int, 10, 2419200] = None):
+        row = await self.bot.db.automod_config.update("automod_config.set_limits", interaction.guild.id, spam_threshold, mute_duration)
+        # 未設定 (NULL) の項目は既定値で表示
+        threshold = row['spam_threshold'] or self.spam_limit
+        mute = row['mute_duration'] or self.spam_mute
+        await interaction.response.send_message(
+            f"🛡️ **AutoMod設定**: 連投 {self.spam_window:.0f}秒に{threshold}件 / タイムアウト {mute}秒"
+        )
+
+    @app_commands.command(name="automod_ignore", description="AutoModの対象外にするチャンネル・ロールを切り替えます")
+    @app_commands.describe(channel="対象外にする(解除する)チャンネル", role="対象外にする(解除する)ロール")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def automod_ignore(self, interaction: discord.Interaction, channel: discord.TextChannel = None, role: discord.Role = None):
+        if channel is None and role is None:
+            return await interaction.response.send_message("❌ チャンネルかロールを指定してください。", ephemeral=True)
+
+        config = self.bot.db.automod_config.get(interaction.guild.id)
+        channels = set(config['ignored_channel_ids']) if config else set()
+        roles = set(config['ignored_role_ids']) if config else set()
+        changes = []
+        if channel is not None:
+            channels ^= {channel.id}
+            changes.append(f"{channel.mention}: {'対象外' if channel.id in channels else '対象'}")
+        if role is not None:
+            roles ^= {role.id}
+            changes.append(f"{role.mention}: {'対象外' if role.id in roles else '対象'}")
+
+        await self.bot.db.automod_config.update(
+            "automod_config.set_ignored", interaction.guild.id,
+            ",".join(map(str, sorted(channels))), ",".join(map(str, sorted(roles)))
+        )
+        await interaction.response.send_message("🛡️ **AutoMod除外設定**\n" + "\n".join(changes), allowed_mentions=discord.AllowedMentions.none())
+
     # --- 🚨 イベントリスナー (AutoMod & Log) ---
 
     @commands.Cog.listener()
@@ -119,20 +225,31 @@ class Moderation(commands.Cog):
         if message.author.bot or not message.guild:
             return
 
-        # 設定取得 (キャッシュ推奨だが簡易実装としてDB都度確認または内部キャッシュ)
-        # 本格運用では on_ready で全サーバー設定をメモリに乗せるのが良い
-        settings = await self.bot.db.fetchrow("SELECT * FROM guild_settings WHERE guild_id = $1", message.guild.id)
+        # 設定取得 (起動時に全サーバー分をメモリに載せたキャッシュから。DBアクセスなし)
+        settings = self.bot.db.guild_settings.get(message.guild.id)
         if not settings:
             return
 
+        # 除外チャンネル・ロールは本文を見る前に集合の包含チェックだけで弾く
+        config = self.bot.db.automod_config.get(message.guild.id)
+        if config:
+            ignored = config['ignored_channel_ids']
+            if message.channel.id in ignored or getattr(message.channel, "parent_id", None) in ignored:
+                return
+            ignored_roles = config['ignored_role_ids']
+            if ignored_roles and not ignored_roles.isdisjoint(role.id for role in getattr(message.author, "roles", ())):
+                return
+
         # 1. 禁止用語チェック
+        # 単語リストは設定が変わるまでコンパイル済みのものを使い回し、本文を1回だけ走査する
         if settings['bad_words']:
-            bad_words = settings['bad_words'].split(',')
-            if any(word.strip() in message.content for word in bad_words if word.strip()):
+            if compile_bad_words(settings['bad_words']).find(message.content) is not None:
                 try:
                     await message.delete()
                     await message.channel.send(f"⚠️ {message.author.mention} 禁止用語が含まれています！", delete_after=5)
                     await self.log_action(message.guild, "AutoMod削除", f"ユーザー: {message.author}\n内容: {message.content}", COLOR_ERROR)
+                    # 自動で警告を付与 (件数はキャッシュから判定するため COUNT クエリなし)
+                    await self.warn_member(message.guild, message.author, message.guild.me, "AutoMod: 禁止用語")
                     return # 処理終了
                 except:
                     pass
@@ -148,22 +265,32 @@ class Moderation(commands.Cog):
                 except:
                     pass
             
-            # 連投検知
-            now = datetime.datetime.now().timestamp()
-            history = self.spam_check[message.guild.id][message.author.id]
-            history.append(now)
-            
-            # 過去5秒以内に5件以上
-            if len(history) >= 5 and (history[-1] - history[0] < 5):
+            # 連投検知 (過去 window 秒以内に limit 件以上)
+            key = (message.guild.id, message.author.id)
+            limit, window = self.spam_thresholds(message.guild.id)
+            if self.spam_detector.hit(key, limit, window) >= limit:
                 try:
                     await message.channel.send(f"🚫 {message.author.mention} 連投をやめてください！ (タイムアウト)", delete_after=5)
-                    # 1分タイムアウト
-                    await message.author.timeout(datetime.timedelta(minutes=1), reason="AutoMod: スパム検知")
-                    history.clear()
+                    await message.author.timeout(datetime.timedelta(seconds=self.spam_mute_seconds(message.guild.id)), reason="AutoMod: スパム検知")
+                    self.spam_detector.clear(key)
                     await self.log_action(message.guild, "AutoMod処罰", f"ユーザー: {message.author}\n理由: 連投スパム", COLOR_ERROR)
                 except:
                     pass
 
+    def spam_thresholds(self, guild_id):
+        """連投とみなす (件数, 秒数)。件数は automod_config.spam_threshold"""
+        config = self.bot.db.automod_config.get(guild_id)
+        if config and config['spam_threshold']:
+            return config['spam_threshold'], self.spam_window
+        return self.spam_limit, self.spam_window
+
+    def spam_mute_seconds(self, guild_id):
+        """連投時のタイムアウト秒数 (automod_config.mute_duration)"""
+        config = self.bot.db.automod_config.get(guild_id)
+        if config and config['mute_duration']:
+            return config['mute_duration']
+        return self.spam_mute
+
     @commands.Cog.listener()
     async def on_message_delete(self, message):
         if message.author.bot or not message.guild: return
@@ -175,14 +302,64 @@ class Moderation(commands.Cog):
         await self.log_action(before.guild, "メッセージ編集", f"場所: {before.channel.mention}\nユーザー: {before.author}\n[前]: {before.content}\n[後]: {after.content}", 0x3498db)
 
     async def log_action(self, guild, action, details, color):
-        """ログチャンネルにEmbedを送信"""
-        row = await self.bot.db.fetchrow("SELECT log_channel_id FROM guild_settings WHERE guild_id = $1", guild.id)
-        if row and row['log_channel_id']:
-            channel = guild.get_channel(row['log_channel_id'])
-            if channel:
-                embed = discord.Embed(title=f"📝 {action}", description=details, color=color, timestamp=discord.utils.utcnow())
-                embed.set_footer(text=f"Server: {guild.name}")
-                await channel.send(embed=embed)
+        """ログチャンネル宛のEmbedを送信キューに積む (送信はまとめてバックグラウンドで)"""
+        settings = self.bot.db.guild_settings.get(guild.id)
+        if settings and settings['log_channel_id']:
+            # 1件が長すぎてまとめた送信ごと失敗しないよう説明文の上限 (4096) 内に収める
+            if len(details) > 4000:
+                details = details[:4000] + "…"
+            embed = discord.Embed(title=f"📝 {action}", description=details, color=color, timestamp=discord.utils.utcnow())
+            embed.set_footer(text=f"Server: {guild.name}")
+            self.mod_log.log(guild.id, settings['log_channel_id'], embed)
+
+# --- 警告履歴用 View (ページ送り) ---
+class WarningsView(discord.ui.View):
+    def __init__(self, bot, owner_id, guild_id, member):
+        super().__init__(timeout=120)
+        self.bot = bot
+        self.owner_id = owner_id
+        self.guild_id = guild_id
+        self.member = member
+        self.rows = []
+        # 各ページ先頭の before_id (前のページに戻る用)
+        self.cursors = [None]
+        self.has_next = False
+
+    async def load(self):
+        # 1件多く取って次のページがあるか判定
+        rows = await self.bot.db.warnings.page(self.guild_id, self.member.id, self.cursors[-1], WARN_PAGE_SIZE + 1)
+        self.has_next = len(rows) > WARN_PAGE_SIZE
+        self.rows = rows[:WARN_PAGE_SIZE]
+        self.prev_page.disabled = len(self.cursors) == 1
+        self.next_page.disabled = not self.has_next
+
+    def embed(self):
+        embed = discord.Embed(title=f"⚠️ {self.member.display_name} の警告履歴", color=COLOR_WARN)
+        if not self.rows:
+            embed.description = "警告はありません。"
+        else:
+            embed.description = "\n".join(
+                f"`#{row['id']}` {row['timestamp'].strftime('%Y/%m/%d %H:%M') if row['timestamp'] else '-'} "
+                f"<@{row['moderator_id']}>: {row['reason']}"
+                for row in self.rows
+            )
+        embed.set_footer(text=f"ページ {len(self.cursors)}")
+        return embed
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        return interaction.user.id == self.owner_id
+
+    @discord.ui.button(label="前へ", style=discord.ButtonStyle.secondary, emoji="◀️")
+    async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.cursors.pop()
+        await self.load()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+    @discord.ui.button(label="次へ", style=discord.ButtonStyle.secondary, emoji="▶️")
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.cursors.append(self.rows[-1]['id'])
+        await self.load()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
 
 async def setup(bot):
     await bot.add_cog(Moderation(bot))
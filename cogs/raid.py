@@ -0,0 +1,247 @@
+import discord
+from discord import app_commands
+from discord.ext import commands
+import asyncio
+import datetime
+import os
+import re
+from collections import deque
+from utils.bulk import run_bulk
+from utils.constants import COLOR_ERROR, COLOR_SUCCESS, COLOR_WARN
+from utils.rate_window import RateWindow
+
+# 参加検知: RAID_JOIN_WINDOW 秒以内に RAID_JOIN_LIMIT 人が参加したらロックダウン
+RAID_JOIN_LIMIT = int(os.getenv("RAID_JOIN_LIMIT", 10))
+RAID_JOIN_WINDOW = float(os.getenv("RAID_JOIN_WINDOW", 10))
+# ロックダウン中に参加したメンバーのタイムアウト分数 (0で無効)
+RAID_LOCKDOWN_TIMEOUT = int(os.getenv("RAID_LOCKDOWN_TIMEOUT", 10))
+# 一括処罰の同時実行数と1回あたりの上限
+RAID_CONCURRENCY = int(os.getenv("RAID_CONCURRENCY", 5))
+RAID_MAX_TARGETS = int(os.getenv("RAID_MAX_TARGETS", 1000))
+# 「直近N分の参加者」用に覚えておく参加履歴の件数 (サーバーごと)
+RAID_JOIN_HISTORY = int(os.getenv("RAID_JOIN_HISTORY", 2000))
+
+
+class Raid(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        # サーバーごとの参加レート
+        self.join_rate = RateWindow(idle_ttl=max(RAID_JOIN_WINDOW, 60))
+        # 直近の参加者 {guild_id: deque([(参加時刻, user_id), ...])}
+        self.recent_joins = {}
+        # ロックダウン中のサーバー {guild_id: 変更前の認証レベル} (raid_lockdowns テーブルにも保存)
+        self.lockdowns = {}
+        # 自動解除タスク {guild_id: Task}
+        self.release_tasks = {}
+        self.resume_task = None
+
+    async def cog_load(self):
+        self.resume_task = asyncio.create_task(self.resume_lockdowns())
+
+    async def cog_unload(self):
+        # 状態はDBに残るので、次に読み込んだときに再開・解除される
+        if self.resume_task is not None:
+            self.resume_task.cancel()
+        for task in self.release_tasks.values():
+            task.cancel()
+
+    raid_group = app_commands.Group(name="raid", description="荒らし(レイド)対策")
+
+    # --- 🚨 参加検知 ---
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        guild = member.guild
+        joins = self.recent_joins.get(guild.id)
+        if joins is None:
+            joins = self.recent_joins[guild.id] = deque(maxlen=RAID_JOIN_HISTORY)
+        joins.append((discord.utils.utcnow(), member.id))
+
+        if guild.id in self.lockdowns:
+            if RAID_LOCKDOWN_TIMEOUT > 0:
+                try:
+                    await member.timeout(datetime.timedelta(minutes=RAID_LOCKDOWN_TIMEOUT), reason="Raid: ロックダウン中の参加")
+                except discord.HTTPException:
+                    pass
+            return
+
+        if self.join_rate.hit(guild.id, RAID_JOIN_LIMIT, RAID_JOIN_WINDOW) >= RAID_JOIN_LIMIT:
+            self.join_rate.clear(guild.id)
+            await self.enable_lockdown(guild, 30, f"自動検知 ({RAID_JOIN_WINDOW:.0f}秒で{RAID_JOIN_LIMIT}人が参加)")
+
+    # --- 🔒 ロックダウン ---
+
+    async def resume_lockdowns(self):
+        """再起動前のロックダウンを引き継ぐ (期限切れならすぐ解除)"""
+        await self.bot.wait_until_ready()
+        try:
+            rows = await self.bot.db.fetch("raid_lockdowns.all")
+        except Exception as e:
+            print(f"⚠️ ロックダウン状態の読み込みに失敗: {e}")
+            return
+        now = discord.utils.utcnow().replace(tzinfo=None)
+        for row in rows:
+            # 他のクラスタのサーバーはそちらで再開する
+            guild = self.bot.get_guild(row['guild_id'])
+            if guild is None or guild.id in self.lockdowns:
+                continue
+            self.lockdowns[guild.id] = discord.VerificationLevel(row['previous_level'])
+            if row['release_at'] is not None:
+                delay = max(0.0, (row['release_at'] - now).total_seconds())
+                self.release_tasks[guild.id] = asyncio.create_task(self._auto_release(guild, delay))
+        if rows:
+            print(f"✅ Raid: {len(self.lockdowns)}件のロックダウンを再開しました")
+
+    async def enable_lockdown(self, guild, minutes, reason):
+        if guild.id in self.lockdowns:
+            return False
+        previous = self.lockdowns[guild.id] = guild.verification_level
+        release_at = discord.utils.utcnow().replace(tzinfo=None) + datetime.timedelta(minutes=minutes) if minutes > 0 else None
+        try:
+            row = await self.bot.db.fetchrow("raid_lockdowns.set", guild.id, previous.value, release_at)
+            self.lockdowns[guild.id] = discord.VerificationLevel(row['previous_level'])
+        except Exception as e:
+            print(f"⚠️ ロックダウン状態の保存に失敗 ({guild.name}): {e}")
+        try:
+            await guild.edit(verification_level=discord.VerificationLevel.highest, reason=f"Raid: {reason}")
+        except discord.HTTPException:
+            pass
+        if minutes > 0:
+            self.release_tasks[guild.id] = asyncio.create_task(self._auto_release(guild, minutes * 60))
+        await self.log(guild, "ロックダウン開始", f"理由: {reason}\n自動解除: {f'{minutes}分後' if minutes > 0 else 'なし'}", COLOR_ERROR)
+        return True
+
+    async def disable_lockdown(self, guild, reason):
+        if guild.id not in self.lockdowns:
+            return False
+        previous = self.lockdowns.pop(guild.id)
+        task = self.release_tasks.pop(guild.id, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        try:
+            await guild.edit(verification_level=previous, reason=f"Raid: {reason}")
+        except discord.HTTPException:
+            pass
+        try:
+            await self.bot.db.execute("raid_lockdowns.delete", guild.id)
+        except Exception as e:
+            print(f"⚠️ ロックダウン状態の削除に失敗 ({guild.name}): {e}")
+        await self.log(guild, "ロックダウン解除", f"理由: {reason}", COLOR_SUCCESS)
+        return True
+
+    async def _auto_release(self, guild, delay):
+        await asyncio.sleep(delay)
+        await self.disable_lockdown(guild, "時間経過による自動解除")
+
+    async def log(self, guild, action, details, color):
+        moderation = self.bot.get_cog("Moderation")
+        if moderation:
+            await moderation.log_action(guild, action, details, color)
+
+    @raid_group.command(name="lockdown", description="ロックダウン(認証レベル最大・新規参加者をタイムアウト)を切り替えます")
+    @app_commands.describe(enabled="有効/無効", minutes="自動解除までの分数 (0で手動解除のみ)")
+    @app_commands.checks.has_permissions(manage_guild=True)
+    async def lockdown(self, interaction: discord.Interaction, enabled: bool, minutes: int = 30):
+        if enabled:
+            changed = await self.enable_lockdown(interaction.guild, minutes, f"手動 ({interaction.user})")
+            msg = "🔒 ロックダウンを開始しました。" if changed else "⚠️ すでにロックダウン中です。"
+        else:
+            changed = await self.disable_lockdown(interaction.guild, f"手動 ({interaction.user})")
+            msg = "🔓 ロックダウンを解除しました。" if changed else "⚠️ ロックダウン中ではありません。"
+        await interaction.response.send_message(msg)
+
+    # --- 🔨 一括処罰 ---
+
+    async def collect_targets(self, interaction, user_ids, joined_within):
+        """IDリスト (空白・カンマ区切り) と「直近N分の参加者」から対象を集める"""
+        guild = interaction.guild
+        ids = set()
+        if user_ids:
+            ids.update(int(x) for x in re.findall(r"\d{15,20}", user_ids))
+        if joined_within:
+            cutoff = discord.utils.utcnow() - datetime.timedelta(minutes=joined_within)
+            ids.update(uid for joined_at, uid in self.recent_joins.get(guild.id, ()) if joined_at >= cutoff)
+            # 起動前の参加者はメンバーキャッシュから補う
+            ids.update(m.id for m in guild.members if m.joined_at and m.joined_at >= cutoff)
+
+        ids.discard(interaction.user.id)
+        ids.discard(self.bot.user.id)
+        ids.discard(guild.owner_id)
+        ids = sorted(ids)[:RAID_MAX_TARGETS]
+        if interaction.user.id == guild.owner_id:
+            return ids
+
+        # 実行者以上のロールを持つメンバーは対象外
+        # (キャッシュに無いメンバーも取得して確認する。lean プロファイルではほぼ全員が該当)
+        semaphore = asyncio.Semaphore(RAID_CONCURRENCY)
+
+        async def allowed(uid):
+            member = guild.get_member(uid)
+            if member is None:
+                async with semaphore:
+                    try:
+                        member = await guild.fetch_member(uid)
+                    except discord.NotFound:
+                        # サーバーにいないユーザー (ロールなし) はBAN対象にできる
+                        return True
+                    except discord.HTTPException:
+                        # ロールを確認できない場合は対象にしない
+                        return False
+            return member.top_role < interaction.user.top_role
+
+        results = await asyncio.gather(*(allowed(uid) for uid in ids))
+        return [uid for uid, ok in zip(ids, results) if ok]
+
+    async def run_bulk_action(self, interaction, action_name, targets, action):
+        if not targets:
+            return await interaction.followup.send("❌ 対象のユーザーがいません。", ephemeral=True)
+
+        await interaction.followup.send(f"⏳ {action_name}: 0/{len(targets)}")
+
+        async def progress(done, total):
+            await interaction.edit_original_response(content=f"⏳ {action_name}: {done}/{total}")
+
+        started = discord.utils.utcnow()
+        succeeded, failed = await run_bulk(targets, action, concurrency=RAID_CONCURRENCY, progress=progress)
+        elapsed = (discord.utils.utcnow() - started).total_seconds()
+
+        summary = f"✅ {action_name}完了: 成功 {len(succeeded)}件 / 失敗 {len(failed)}件 ({elapsed:.1f}秒)"
+        await interaction.edit_original_response(content=summary)
+        await self.log(
+            interaction.guild,
+            f"一括{action_name}",
+            f"実行者: {interaction.user}\n成功: {len(succeeded)}件 / 失敗: {len(failed)}件\n対象: {', '.join(map(str, succeeded[:50]))}{' ...' if len(succeeded) > 50 else ''}",
+            COLOR_WARN,
+        )
+
+    @raid_group.command(name="ban", description="複数ユーザーを一括BANします")
+    @app_commands.describe(user_ids="ユーザーID (空白・カンマ区切り)", joined_within="直近N分以内に参加したメンバーを対象にする")
+    @app_commands.checks.has_permissions(ban_members=True)
+    async def raid_ban(self, interaction: discord.Interaction, user_ids: str = None, joined_within: int = None, reason: str = "Raid対策"):
+        await interaction.response.defer()
+        guild = interaction.guild
+        targets = await self.collect_targets(interaction, user_ids, joined_within)
+
+        async def ban(uid):
+            # 直近1時間のメッセージも削除
+            await guild.ban(discord.Object(id=uid), reason=reason, delete_message_seconds=3600)
+
+        await self.run_bulk_action(interaction, "BAN", targets, ban)
+
+    @raid_group.command(name="timeout", description="複数ユーザーを一括タイムアウトします")
+    @app_commands.describe(user_ids="ユーザーID (空白・カンマ区切り)", joined_within="直近N分以内に参加したメンバーを対象にする", minutes="タイムアウトの分数")
+    @app_commands.checks.has_permissions(moderate_members=True)
+    async def raid_timeout(self, interaction: discord.Interaction, user_ids: str = None, joined_within: int = None, minutes: int = 60, reason: str = "Raid対策"):
+        await interaction.response.defer()
+        guild = interaction.guild
+        targets = await self.collect_targets(interaction, user_ids, joined_within)
+        duration = datetime.timedelta(minutes=minutes)
+
+        async def timeout(uid):
+            member = guild.get_member(uid) or await guild.fetch_member(uid)
+            await member.timeout(duration, reason=reason)
+
+        await self.run_bulk_action(interaction, "タイムアウト", targets, timeout)
+
+async def setup(bot):
+    await bot.add_cog(Raid(bot))
@@ -1,86 +1,108 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-import yt_dlp
 import asyncio
 import os
-from collections import deque
 from utils.constants import COLOR_MAIN, COLOR_ERROR, COLOR_SUCCESS
+from utils.audio_cache import AudioCache, url_cache_key
+from utils.music import DEFAULT_VOLUME, LOOP_MODES, MUSIC_OPUS, GuildPlayer, Track, format_duration, parse_position
+from utils.ytdl import Extractor, is_playlist_url
 
-# --- yt-dlp 設定 (Cookie対応・エラー回避) ---
-YTDL_OPTS = {
-    'format': 'bestaudio/best',
-    'outtmpl': '%(extractor)s-%(id)s-%(title)s.%(ext)s',
-    'restrictfilenames': True,
-    'noplaylist': True,
-    'nocheckcertificate': True,
-    'ignoreerrors': False,
-    'logtostderr': False,
-    'quiet': True,
-    'no_warnings': True,
-    'default_search': 'auto',
-    'source_address': '0.0.0.0',
-    # Cookieファイルが存在する場合のみ読み込む (main.pyで生成済み)
-    'cookiefile': 'cookies.txt' if os.path.exists('cookies.txt') else None,
-    # ユーザーエージェント偽装 (Bot検知回避)
-    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-}
-
-# --- FFmpeg 設定 (再接続オプションで安定化) ---
-FFMPEG_OPTIONS = {
-    'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
-    'options': '-vn'
-}
+# プレイリスト読み込み: 1回のコマンドで予約する最大曲数と、1回の抽出で取得する件数
+PLAYLIST_LIMIT = int(os.getenv("PLAYLIST_LIMIT", 500))
+PLAYLIST_CHUNK = int(os.getenv("PLAYLIST_CHUNK", 50))
+
+# AUDIO_CACHE_DIR を設定すると、再生した曲を Opus ファイルとして保存し次回からそれを流す
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR")
+AUDIO_CACHE_MAX_MB = int(os.getenv("AUDIO_CACHE_MAX_MB", 1024))
+# これより長い曲 (秒) とライブ配信は保存しない
+AUDIO_CACHE_MAX_DURATION = int(os.getenv("AUDIO_CACHE_MAX_DURATION", 900))
 
 class VoiceMusic(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        # サーバーごとのキュー {guild_id: deque([source, ...])}
-        self.queues = {}
-        # ループ設定 {guild_id: bool}
-        self.loops = {}
-        # 現在再生中の曲情報 {guild_id: title}
-        self.now_playing = {}
-        # 音量設定 {guild_id: float(0.0-1.0)}
-        self.volumes = {}
-
-    def get_queue(self, guild_id):
-        if guild_id not in self.queues:
-            self.queues[guild_id] = deque()
-        return self.queues[guild_id]
-
-    def play_next(self, interaction: discord.Interaction):
-        guild_id = interaction.guild.id
-        queue = self.get_queue(guild_id)
-        
-        if not queue:
-            self.now_playing.pop(guild_id, None)
-            return
+        # サーバーごとの再生キューと状態 {guild_id: GuildPlayer}
+        self.players = {}
+        # yt-dlp の抽出 (別プロセス・結果キャッシュ付き)
+        self.extractor = Extractor(
+            workers=int(os.getenv("YTDL_WORKERS", 2)),
+            concurrency=int(os.getenv("YTDL_CONCURRENCY", 4)),
+            ttl=float(os.getenv("YTDL_CACHE_TTL", 1800)),
+        )
+        # 再生済みの曲のディスクキャッシュ (任意)
+        self.audio_cache = None
+        if AUDIO_CACHE_DIR:
+            self.audio_cache = AudioCache(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_MB * 1024 * 1024, AUDIO_CACHE_MAX_DURATION)
 
-        # 次の曲を取得
-        source, title = queue.popleft()
-        self.now_playing[guild_id] = title
-        
-        vc = interaction.guild.voice_client
-        if not vc:
-            return
+    async def cog_load(self):
+        if self.audio_cache is not None:
+            await asyncio.to_thread(self.audio_cache.load)
 
-        # 音量適用
-        volume = self.volumes.get(guild_id, 0.5) # デフォルト50%
-        source.volume = volume
+    async def cog_unload(self):
+        for player in self.players.values():
+            player.close()
+        self.players.clear()
+        self.extractor.close()
+        if self.audio_cache is not None:
+            await self.audio_cache.close()
 
-        # 再生終了後のコールバック
-        def after_playing(error):
-            if error:
-                print(f"Player error: {error}")
-            # ループ有効なら再度キューに追加（簡易実装）
-            # 本格的なループはSourceを再生成する必要があるため、今回はキュー消化のみ
-            self.play_next(interaction)
+    def get_player(self, guild, channel=None):
+        """サーバーの GuildPlayer を返す (無ければ作成)。channel を渡すと再生通知先を更新"""
+        player = self.players.get(guild.id)
+        if player is None:
+            player = self.players[guild.id] = GuildPlayer(guild, self.extractor, self.audio_cache, channel)
+        elif channel is not None:
+            player.channel = channel
+        return player
 
-        vc.play(source, after=after_playing)
-        
-        # テキストチャンネルに通知（非同期で送信するために工夫が必要だが、ここではログのみ）
-        print(f"🎵 Now playing in {interaction.guild.name}: {title}")
+    def cached_track(self, query, requester_id):
+        """ディスクキャッシュ済みの動画URLなら、抽出せずに保存済みの情報から Track を作る"""
+        if self.audio_cache is None:
+            return None
+        key = url_cache_key(query)
+        meta = self.audio_cache.metadata(key)
+        if meta is None:
+            return None
+        return Track(meta['webpage_url'], meta.get('title') or 'Unknown Title', meta.get('duration'), requester_id, key)
+
+    def close_player(self, guild_id):
+        player = self.players.pop(guild_id, None)
+        if player is not None:
+            player.close()
+
+    async def import_playlist(self, interaction, url):
+        """プレイリストを少しずつ取得してキューに流し込む (最初の曲が届いた時点で再生開始)"""
+        player = self.get_player(interaction.guild)
+        added = 0
+        try:
+            async for entries in self.extractor.playlist(url, PLAYLIST_LIMIT, PLAYLIST_CHUNK):
+                vc = interaction.guild.voice_client
+                if not vc or not vc.is_connected():
+                    return
+                player.enqueue(Track.from_info(entry, interaction.user.id) for entry in entries)
+                added += len(entries)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await interaction.channel.send(self.error_message(e))
+        finally:
+            if player.import_task is asyncio.current_task():
+                player.import_task = None
+
+        if added:
+            embed = discord.Embed(title="📃 プレイリストを予約しました", description=f"**{added}** 曲を追加しました。", color=COLOR_MAIN)
+            if added >= PLAYLIST_LIMIT:
+                embed.set_footer(text=f"1回の上限は{PLAYLIST_LIMIT}曲です")
+            await interaction.channel.send(embed=embed)
+        else:
+            await interaction.channel.send("❌ プレイリストに再生できる曲がありませんでした。")
+
+    @staticmethod
+    def error_message(e):
+        error_msg = str(e)
+        if "Sign in" in error_msg:
+            return "❌ YouTubeの認証エラーが発生しました。Cookieの設定を確認してください。"
+        return f"❌ 再生エラー: {error_msg}"
 
     @app_commands.command(name="join", description="ボイスチャンネルに参加します")
     async def join(self, interaction: discord.Interaction):
@@ -98,9 +120,8 @@ class VoiceMusic(commands.Cog):
     @app_commands.command(name="leave", description="ボイスチャンネルから退出します")
     async def leave(self, interaction: discord.Interaction):
         if interaction.guild.voice_client:
+            self.close_player(interaction.guild.id)
             await interaction.guild.voice_client.disconnect()
-            self.queues.pop(interaction.guild.id, None)
-            self.now_playing.pop(interaction.guild.id, None)
             await interaction.response.send_message("👋 退出しました。")
         else:
             await interaction.response.send_message("❌ ボイスチャンネルに参加していません。", ephemeral=True)
@@ -120,73 +141,106 @@ class VoiceMusic(commands.Cog):
             except Exception as e:
                 return await interaction.followup.send(f"❌ 接続エラー: {e}")
 
-        vc = interaction.guild.voice_client
-        
-        # 検索と抽出
+        player = self.get_player(interaction.guild, interaction.channel)
+
+        # プレイリストは全件の抽出を待たず、バックグラウンドで順次キューに入れる
+        if is_playlist_url(query):
+            if player.import_task is not None:
+                return await interaction.followup.send("❌ 別のプレイリストを読み込み中です。")
+            player.import_task = asyncio.create_task(self.import_playlist(interaction, query))
+            embed = discord.Embed(title="📃 プレイリストを読み込んでいます...", description=f"最大{PLAYLIST_LIMIT}曲まで順次予約します。", color=COLOR_MAIN)
+            return await interaction.followup.send(embed=embed)
+
+        # 検索と抽出 (プロセスプールで実行するためイベントループは止まらない)
+        # ディスクキャッシュにある動画URLは抽出せず、再生もファイルから行う
         try:
-            with yt_dlp.YoutubeDL(YTDL_OPTS) as ydl:
-                info = ydl.extract_info(query, download=False)
-                
-                # プレイリストの場合は最初の動画
-                if 'entries' in info:
-                    info = info['entries'][0]
-                
-                url = info['url']
-                title = info.get('title', 'Unknown Title')
-                
-                # FFmpegオーディオソース作成
-                source = discord.PCMVolumeTransformer(
-                    discord.FFmpegPCMAudio(url, **FFMPEG_OPTIONS)
-                )
-                # 音量初期設定
-                source.volume = self.volumes.get(interaction.guild.id, 0.5)
-
-                queue = self.get_queue(interaction.guild.id)
-                
-                if vc.is_playing() or vc.is_paused():
-                    queue.append((source, title))
-                    embed = discord.Embed(title="🎵 予約しました", description=f"**{title}**", color=COLOR_MAIN)
-                    await interaction.followup.send(embed=embed)
-                else:
-                    queue.append((source, title)) # play_nextでpopするため一度入れる
-                    self.play_next(interaction)
-                    embed = discord.Embed(title="▶️ 再生開始", description=f"**{title}**", color=COLOR_SUCCESS)
-                    await interaction.followup.send(embed=embed)
-                    
-        except Exception as e:
-            # エラーログ詳細
-            error_msg = str(e)
-            if "Sign in" in error_msg:
-                msg = "❌ YouTubeの認証エラーが発生しました。Cookieの設定を確認してください。"
+            track = self.cached_track(query, interaction.user.id)
+            if track is None:
+                info = await self.extractor.extract(query)
+                # キューには曲情報だけを積む (オーディオソースは再生直前に作成)
+                track = Track.from_info(info, interaction.user.id)
+            title = track.title
+
+            # 再生は GuildPlayer のタスクが順に行う
+            queued = player.is_active
+            player.enqueue([track])
+            if queued:
+                embed = discord.Embed(title="🎵 予約しました", description=f"**{title}**", color=COLOR_MAIN)
+                embed.set_footer(text=f"キューの{len(player.queue)}番目")
             else:
-                msg = f"❌ 再生エラー: {error_msg}"
-            await interaction.followup.send(msg)
+                embed = discord.Embed(title="▶️ 再生開始", description=f"**{title}**", color=COLOR_SUCCESS)
+            await interaction.followup.send(embed=embed)
+
+        except Exception as e:
+            await interaction.followup.send(self.error_message(e))
 
     @app_commands.command(name="music_stop", description="音楽を停止し、キューをクリアします")
     async def music_stop(self, interaction: discord.Interaction):
-        vc = interaction.guild.voice_client
-        if vc and vc.is_playing():
-            vc.stop()
-            self.queues[interaction.guild.id].clear()
+        player = self.players.get(interaction.guild.id)
+        if player and player.is_active:
+            player.stop()
             await interaction.response.send_message("⏹️ 停止しました。")
         else:
             await interaction.response.send_message("❌ 再生していません。", ephemeral=True)
 
     @app_commands.command(name="music_volume", description="音量を調整します (1-100)")
-    @app_commands.describe(volume="音量 (デフォルト: 50)")
+    @app_commands.describe(volume=f"音量 (デフォルト: {DEFAULT_VOLUME})" + (" ※100以外は再エンコードのため負荷が増えます" if MUSIC_OPUS else ""))
     async def music_volume(self, interaction: discord.Interaction, volume: int):
         if not 1 <= volume <= 100:
             return await interaction.response.send_message("❌ 1〜100の間で指定してください。", ephemeral=True)
         
-        vol_float = volume / 100
-        self.volumes[interaction.guild.id] = vol_float
-        
-        vc = interaction.guild.voice_client
-        if vc and vc.source:
-            vc.source.volume = vol_float
-            
+        self.get_player(interaction.guild).set_volume(volume / 100)
         await interaction.response.send_message(f"🔊 音量を **{volume}%** に設定しました。")
 
+    @app_commands.command(name="music_skip", description="再生中の曲をスキップします")
+    async def music_skip(self, interaction: discord.Interaction):
+        player = self.players.get(interaction.guild.id)
+        if not player or player.current is None:
+            return await interaction.response.send_message("❌ 再生していません。", ephemeral=True)
+        title = player.current.title
+        if not player.skip():
+            return await interaction.response.send_message("❌ 曲を準備中です。少し待ってください。", ephemeral=True)
+        await interaction.response.send_message(f"⏭️ **{title}** をスキップしました。")
+
+    @app_commands.command(name="music_loop", description="ループ再生を設定します")
+    @app_commands.describe(mode="ループの範囲")
+    @app_commands.choices(mode=[app_commands.Choice(name=name, value=value) for value, name in LOOP_MODES.items()])
+    async def music_loop(self, interaction: discord.Interaction, mode: str):
+        self.get_player(interaction.guild).loop_mode = mode
+        await interaction.response.send_message(f"🔁 ループを **{LOOP_MODES[mode]}** に設定しました。")
+
+    @app_commands.command(name="music_shuffle", description="キューをシャッフルします")
+    async def music_shuffle(self, interaction: discord.Interaction):
+        player = self.players.get(interaction.guild.id)
+        if not player or len(player.queue) < 2:
+            return await interaction.response.send_message("❌ シャッフルする曲がありません。", ephemeral=True)
+        player.shuffle()
+        await interaction.response.send_message(f"🔀 {len(player.queue)}曲をシャッフルしました。")
+
+    @app_commands.command(name="music_seek", description="再生位置を移動します")
+    @app_commands.describe(position="移動先 (例: 90 / 1:30)")
+    async def music_seek(self, interaction: discord.Interaction, position: str):
+        player = self.players.get(interaction.guild.id)
+        if not player or player.info is None:
+            return await interaction.response.send_message("❌ 再生していません。", ephemeral=True)
+        seconds = parse_position(position)
+        if seconds is None:
+            return await interaction.response.send_message("❌ 位置は秒数か 分:秒 で指定してください。", ephemeral=True)
+        duration = player.current.duration
+        if not duration:
+            return await interaction.response.send_message("❌ ライブ配信はシークできません。", ephemeral=True)
+        if seconds >= duration:
+            return await interaction.response.send_message(f"❌ 曲の長さ ({format_duration(duration)}) より前を指定してください。", ephemeral=True)
+        player.restart(seconds)
+        await interaction.response.send_message(f"⏩ **{format_duration(seconds)}** に移動しました。")
+
+    @app_commands.command(name="music_nowplaying", description="再生中の曲を表示します")
+    async def music_nowplaying(self, interaction: discord.Interaction):
+        player = self.players.get(interaction.guild.id)
+        if not player or player.current is None:
+            return await interaction.response.send_message("❌ 再生していません。", ephemeral=True)
+        await interaction.response.send_message(embed=player.now_playing_embed(), allowed_mentions=discord.AllowedMentions.none())
+
     @app_commands.command(name="tts_join", description="読み上げを開始します (簡易版)")
     async def tts_join(self, interaction: discord.Interaction):
         # 簡易実装: gTTSなどの外部ライブラリがない場合を考慮し、
@@ -196,8 +250,10 @@ class VoiceMusic(commands.Cog):
     # --- 自動退室リスナー ---
     @commands.Cog.listener()
     async def on_voice_state_update(self, member, before, after):
-        # Bot自身の更新は無視
+        # Bot自身が切断された (キック・/leave 以外の退出) ら再生状態を破棄
         if member.id == self.bot.user.id:
+            if before.channel and not after.channel:
+                self.close_player(member.guild.id)
             return
             
         # Botがいるチャンネルのメンバー数を確認
@@ -208,6 +264,7 @@ class VoiceMusic(commands.Cog):
                 await asyncio.sleep(30) # 30秒待機
                 # 再確認
                 if len([m for m in voice_client.channel.members if not m.bot]) == 0:
+                    self.close_player(member.guild.id)
                     await voice_client.disconnect()
                     # ログなどを送る処理を入れることも可能
 
@@ -1,12 +1,16 @@
 import discord
+from discord import app_commands
 from discord.ext import commands
 import os
 import asyncio
 import logging
+import signal
 from aiohttp import web
 
 # 👇【変更点1】パスを変更 (utilsフォルダから読み込む)
-from utils.database import Database 
+from utils.cache_profile import cache_options
+from utils.database import create_database
+from utils.ipc import ClusterIPC
 
 # --- ログ設定 ---
 logging.basicConfig(level=logging.INFO)
@@ -17,18 +21,34 @@ TOKEN = os.getenv("DISCORD_TOKEN")
 PORT = int(os.getenv("PORT", 8000))
 DATABASE_URL = os.getenv("DATABASE_URL") # DBのURLを取得しておく
 
-class RumiaBot(commands.Bot):
+# --- シャーディング / クラスタ (cluster.py から起動された場合に設定される) ---
+CLUSTER_ID = int(os.getenv("CLUSTER_ID", 0))
+CLUSTER_COUNT = int(os.getenv("CLUSTER_COUNT", 1))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT")) if os.getenv("SHARD_COUNT") else None
+SHARD_IDS = [int(x) for x in os.getenv("SHARD_IDS").split(",")] if os.getenv("SHARD_IDS") else None
+IPC_SECRET = os.getenv("IPC_SECRET", "")
+
+class RumiaBot(commands.AutoShardedBot):
     def __init__(self):
-        intents = discord.Intents.all()
+        # シャード未指定なら Discord の推奨数で自動シャーディング (単一プロセス)
+        shard_options = {}
+        if SHARD_COUNT is not None:
+            shard_options["shard_count"] = SHARD_COUNT
+            if SHARD_IDS is not None:
+                shard_options["shard_ids"] = SHARD_IDS
         super().__init__(
             command_prefix="/",
-            intents=intents,
             help_command=None,
-            activity=discord.Game(name="/help | 起動中...")
+            activity=discord.Game(name="/help | 起動中..."),
+            **shard_options,
+            # Intents・メンバーキャッシュ・チャンク取得 (CACHE_PROFILE=full / lean)
+            **cache_options()
         )
         
-        # 👇【変更点2】URLを引数として渡す
-        self.db = Database(DATABASE_URL)
+        # 👇【変更点2】URLを引数として渡す (スキームで Postgres / SQLite を切り替え)
+        self.db = create_database(DATABASE_URL)
+        # クラスタ間の統計問い合わせ (Web サーバーは PORT + CLUSTER_ID で待ち受け)
+        self.ipc = ClusterIPC(self, cluster_id=CLUSTER_ID, cluster_count=CLUSTER_COUNT, base_port=PORT, secret=IPC_SECRET)
         
         self.start_time = discord.utils.utcnow()
 
@@ -39,10 +59,21 @@ class RumiaBot(commands.Bot):
         self.prepare_fonts()
         self.create_cookie_file()
         self.loop.create_task(self.start_web_server())
+        self.loop.create_task(self.presence_loop())
+
+        # SIGTERM (docker stop 等) でも close() を通して残高キャッシュを書き戻す
+        try:
+            self.loop.add_signal_handler(signal.SIGTERM, lambda: self.loop.create_task(self.close()))
+        except NotImplementedError:
+            pass
+
+        self.tree.on_error = self.on_app_command_error
 
         initial_extensions = [
             "cogs.basic",
             "cogs.moderation",
+            "cogs.raid",
+            "cogs.auto_response",
             "cogs.economy",
             "cogs.entertainment",
             "cogs.games",
@@ -63,9 +94,39 @@ class RumiaBot(commands.Bot):
         except Exception as e:
             print(f"❌ Sync failed: {e}")
 
+    async def close(self):
+        await super().close()
+        await self.ipc.close()
+        await self.db.close()
+
     async def on_ready(self):
-        print(f"🚀 {self.user} としてログインしました (ID: {self.user.id})")
-        await self.change_presence(activity=discord.Game(name=f"/help | {len(self.guilds)} servers"))
+        print(f"🚀 {self.user} としてログインしました (ID: {self.user.id}, Cluster: {CLUSTER_ID}, Shards: {sorted(self.shards)})")
+        await self.update_presence()
+
+    async def on_app_command_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        # クールダウン中はメモリ上の判定だけで返答 (DBには触れない)
+        if isinstance(error, app_commands.CommandOnCooldown):
+            msg = f"⏳ クールダウン中です。あと {error.retry_after:.0f}秒待ってください。"
+            if interaction.response.is_done():
+                await interaction.followup.send(msg, ephemeral=True)
+            else:
+                await interaction.response.send_message(msg, ephemeral=True)
+            return
+        await app_commands.CommandTree.on_error(self.tree, interaction, error)
+
+    async def update_presence(self):
+        # クラスタ構成では全クラスタ合計のサーバー数を表示
+        totals = await self.ipc.totals()
+        await self.change_presence(activity=discord.Game(name=f"/help | {totals['guilds']} servers"))
+
+    async def presence_loop(self):
+        await self.wait_until_ready()
+        while not self.is_closed():
+            await asyncio.sleep(600)
+            try:
+                await self.update_presence()
+            except Exception as e:
+                print(f"⚠️ プレゼンス更新エラー: {e}")
 
     def prepare_fonts(self):
         if not os.path.exists("fonts"):
@@ -92,15 +153,36 @@ class RumiaBot(commands.Bot):
     async def start_web_server(self):
         app = web.Application()
         app.router.add_get('/', self.handle_health_check)
+        app.router.add_get('/health', self.handle_cluster_health)
+        app.router.add_get('/stats', self.handle_stats)
+        app.router.add_get('/ipc/stats', self.ipc.handle_stats)
         runner = web.AppRunner(app)
         await runner.setup()
-        site = web.TCPSite(runner, '0.0.0.0', PORT)
+        site = web.TCPSite(runner, '0.0.0.0', self.ipc.port)
         await site.start()
-        print(f"🌍 Web Server started on port {PORT}")
+        print(f"🌍 Web Server started on port {self.ipc.port}")
 
     async def handle_health_check(self, request):
         return web.Response(text="OK", status=200)
 
+    async def handle_cluster_health(self, request):
+        # このクラスタの各シャードの接続状態。全シャード接続中なら 200、そうでなければ 503
+        shards = {
+            shard_id: {"closed": shard.is_closed(), "latency": shard.latency}
+            for shard_id, shard in self.shards.items()
+        }
+        healthy = self.is_ready() and not any(s["closed"] for s in shards.values())
+        body = {"cluster_id": CLUSTER_ID, "ready": self.is_ready(), "shards": shards}
+        return web.json_response(body, status=200 if healthy else 503)
+
+    async def handle_stats(self, request):
+        # DB接続プールの状態 (枯渇の監視・チューニング用) と連投検知のメモリ使用量
+        stats = {"db_pool": self.db.pool_stats()}
+        moderation = self.get_cog("Moderation")
+        if moderation:
+            stats["spam_detector"] = moderation.spam_detector.memory_usage()
+        return web.json_response(stats)
+
 if __name__ == "__main__":
     bot = RumiaBot()
     if not TOKEN:
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import os
+import re
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlparse
+
+# ネットワーク越しに読むときの再接続オプション (utils/music.py と同じ)
+_RECONNECT_OPTIONS = ("-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "5")
+
+_YOUTUBE_HOSTS = ("youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com")
+_YOUTUBE_ID = re.compile(r"[A-Za-z0-9_-]{11}")
+# 再生前に曲情報として使う項目 (ファイルと一緒に保存する)
+META_KEYS = ("title", "duration", "webpage_url")
+
+
+def cache_key(info):
+    """extractor と動画IDからキャッシュのキーを作る (どちらか無ければ None)"""
+    extractor, video_id = info.get("extractor"), info.get("id")
+    if not extractor or not video_id:
+        return None
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", f"{extractor}-{video_id}")
+
+
+def url_cache_key(query):
+    """YouTube の動画URLならネットワークを使わずにキャッシュのキーを作る (それ以外は None)"""
+    parsed = urlparse(query.strip())
+    host = (parsed.hostname or "").lower()
+    parts = parsed.path.strip("/").split("/")
+    if host == "youtu.be":
+        video_id = parts[0]
+    elif host in _YOUTUBE_HOSTS and parts[0] == "watch":
+        video_id = parse_qs(parsed.query).get("v", [""])[0]
+    elif host in _YOUTUBE_HOSTS and parts[0] in ("shorts", "live", "embed") and len(parts) > 1:
+        video_id = parts[1]
+    else:
+        return None
+    if not _YOUTUBE_ID.fullmatch(video_id):
+        return None
+    # yt-dlp の extractor 名 (info['extractor']) と揃える
+    return cache_key({"extractor": "youtube", "id": video_id})
+
+
+class AudioCache:
+    """Opus に変換した曲をディスクに置く LRU キャッシュ
+
+    初回再生時にバックグラウンドで ffmpeg を起動してファイルを作り、
+    以降の再生ではネットワークを使わずにそのファイルを直接流します。
+    タイトル等は {key}.json に保存し、URLから直接キーが分かる曲は抽出自体を省けます。
+    合計サイズが max_bytes を超えたら最後に再生された時刻が古いものから削除します
+    (順序はファイルの mtime に保存するため再起動後も引き継がれます)。
+    """
+
+    def __init__(self, directory, max_bytes, max_duration=900, concurrency=1):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_duration = max_duration
+        self.semaphore = asyncio.Semaphore(concurrency)
+        # {key: バイト数} 古い順
+        self.entries = OrderedDict()
+        self.total = 0
+        # 作成中 {key: Task}
+        self.filling = {}
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.opus")
+
+    def meta_path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self):
+        """起動時にディレクトリを走査して索引を作る (作りかけの .part と対応する曲の無い .json は削除)"""
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        metas = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(".part"):
+                os.remove(entry.path)
+            elif entry.name.endswith(".opus"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:-len(".opus")], stat.st_size))
+            elif entry.name.endswith(".json"):
+                metas.append((entry.name[:-len(".json")], entry.path))
+        for _, key, size in sorted(files):
+            self.entries[key] = size
+            self.total += size
+        for key, path in metas:
+            if key not in self.entries:
+                self._discard(path)
+        self.evict()
+        print(f"✅ Audio cache: {len(self.entries)} files ({self.total // (1024 * 1024)} MB)")
+
+    def lookup(self, key):
+        """キャッシュ済みならファイルパスを返し、最近使ったものとして記録する"""
+        if key is None or key not in self.entries:
+            return None
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # 外部から消された
+            self.total -= self.entries.pop(key)
+            return None
+        self.entries.move_to_end(key)
+        return path
+
+    def metadata(self, key):
+        """キャッシュ済みの曲の META_KEYS の情報 (無い・読めなければ None)"""
+        if key is None or key not in self.entries:
+            return None
+        try:
+            with open(self.meta_path(key), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get("webpage_url") else None
+
+    def fill(self, info):
+        """まだ無ければバックグラウンドで作成を始める (ライブ配信・長すぎる曲は対象外)"""
+        key = cache_key(info)
+        duration = info.get("duration")
+        if key is None or key in self.entries or key in self.filling:
+            return
+        if not duration or duration > self.max_duration:
+            return
+        task = self.filling[key] = asyncio.create_task(self._fill(key, info))
+        task.add_done_callback(lambda _: self.filling.pop(key, None))
+
+    async def _fill(self, key, info):
+        path = self.path(key)
+        part = f"{path}.part"
+        # 元が Opus なら入れ物を変えるだけ、それ以外は libopus で変換
+        codec = ("-c:a", "copy") if info.get("acodec") == "opus" else ("-c:a", "libopus", "-b:a", "128k")
+        async with self.semaphore:
+            proc = await asyncio.create_subprocess_exec(
+                "ffmpeg", "-nostdin", "-loglevel", "error", "-y", *_RECONNECT_OPTIONS,
+                "-i", info["url"], "-vn", "-map_metadata", "-1", *codec, "-f", "opus", part,
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+            )
+            try:
+                _, stderr = await proc.communicate()
+            except asyncio.CancelledError:
+                proc.kill()
+                await proc.wait()
+                self._discard(part)
+                raise
+
+        if proc.returncode != 0:
+            print(f"⚠️ Audio cache: 変換に失敗 ({key}): {stderr.decode(errors='replace').strip()[:200]}")
+            self._discard(part)
+            return
+        os.replace(part, path)
+        try:
+            with open(self.meta_path(key), "w", encoding="utf-8") as f:
+                json.dump({k: info.get(k) for k in META_KEYS}, f, ensure_ascii=False)
+        except OSError as e:
+            print(f"⚠️ Audio cache: 曲情報の保存に失敗 ({key}): {e}")
+        size = os.path.getsize(path)
+        self.entries[key] = size
+        self.total += size
+        self.evict()
+
+    def evict(self):
+        while self.total > self.max_bytes and self.entries:
+            key, size = self.entries.popitem(last=False)
+            self.total -= size
+            # 再生中でも ffmpeg は開いたファイルを読み続けられる
+            self._discard(self.path(key))
+            self._discard(self.meta_path(key))
+
+    @staticmethod
+    def _discard(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    async def close(self):
+        tasks = list(self.filling.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,227 @@
+import asyncio
+import os
+import re
+from re import _constants as sre_constants, _parser as sre_parse
+
+MATCH_TYPES = ("exact", "prefix", "regex")
+
+# 正規表現で調べる本文の最大文字数 (バックトラックの量を本文の長さで抑える)
+REGEX_SCAN_MAX = int(os.getenv("AUTO_RESPONSE_SCAN_MAX", 300))
+
+# まとめた正規表現を壊す構文: グローバルなインラインフラグ・後方参照・名前付きグループ
+_UNSAFE_REGEX = re.compile(r"\(\?[aiLmsux]+\)|\\[1-9]|\\g<|\(\?P[<=]")
+
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT, sre_constants.POSSESSIVE_REPEAT}
+# ? のような 0〜1回の繰り返しの上限 (1つごとに試す組み合わせが倍になる)
+_OPTIONAL_MAX = 3
+
+
+def _key(text):
+    return text.strip().casefold()
+
+
+def _backtrack_risk(items, in_repeat=False, counts=None):
+    """バックトラックが爆発しうる構造なら理由を返す
+
+    繰り返しの入れ子・繰り返しの中の | を禁止し、長さが変わる繰り返しは1つまでにします
+    (回数固定の {n} は数えない)。これで1回の検索は本文の長さの2乗程度に収まります。
+    """
+    counts = {"variable": 0, "optional": 0} if counts is None else counts
+    for op, av in items:
+        if op in _REPEATS:
+            low, high, body = av
+            if high > 1:
+                if in_repeat:
+                    return "繰り返しの中に繰り返しは書けません (例: (\\w+)+)"
+                if low != high:
+                    counts["variable"] += 1
+            elif low != high:
+                counts["optional"] += 1
+            if counts["variable"] > 1:
+                return "長さが変わる繰り返し (* + {m,n}) は1つまでです"
+            if counts["optional"] > _OPTIONAL_MAX:
+                return f"? は{_OPTIONAL_MAX}つまでです"
+            reason = _backtrack_risk(body, in_repeat or high > 1, counts)
+        elif op is sre_constants.BRANCH:
+            if in_repeat:
+                return "繰り返しの中に | は書けません (例: (a|ab)*)"
+            reason = None
+            for branch in av[1]:
+                reason = reason or _backtrack_risk(branch, in_repeat, counts)
+        elif op is sre_constants.SUBPATTERN:
+            reason = _backtrack_risk(av[-1], in_repeat, counts)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            reason = _backtrack_risk(av[1], in_repeat, counts)
+        elif op is sre_constants.GROUPREF_EXISTS:
+            reason = _backtrack_risk(av[1], in_repeat, counts) or (av[2] and _backtrack_risk(av[2], in_repeat, counts))
+        else:
+            reason = None
+        if reason:
+            return reason
+    return None
+
+
+def validate_regex(pattern):
+    """正規表現トリガーとして使えるか確認し、使えなければ理由を返す (問題なければ None)"""
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error as e:
+        return f"正規表現が不正です: {e}"
+    if _UNSAFE_REGEX.search(pattern):
+        return "インラインフラグ (?i) ・後方参照・名前付きグループは使えません"
+    # メッセージごとにイベントループ上で実行するため、遅くなりうる書き方は登録させない
+    reason = _backtrack_risk(parsed)
+    if reason:
+        return reason
+    # 索引と同じ形 (名前付きグループで囲んで連結) でも壊れないこと
+    try:
+        re.compile(f"(?P<_ar0>{pattern})|(?P<_ar1>x)", re.IGNORECASE)
+    except re.error as e:
+        return f"正規表現が不正です: {e}"
+    return None
+
+
+class ResponseIndex:
+    """1サーバー分の自動応答トリガーの索引
+
+    完全一致・前方一致はトライ木 (本文を先頭から1回たどるだけ)、
+    正規表現は全パターンを1つにまとめた正規表現で本文の先頭 REGEX_SCAN_MAX 文字だけを判定します。
+    validate_regex を通らないパターン (検査を厳しくする前に登録されたもの) は使いません。
+    優先順位は 完全一致 > 前方一致 (長い方優先) > 正規表現。
+    """
+
+    __slots__ = ("rows", "_trie", "_regex", "_regex_rows", "_fallback")
+
+    def __init__(self, rows):
+        self.rows = {row['id']: row for row in rows}
+        # ノード = [子 {文字: ノード}, 完全一致の行, 前方一致の行]
+        self._trie = [{}, None, None]
+        patterns = []
+        self._regex_rows = {}
+        # まとめられないパターン [(Pattern, row)]
+        self._fallback = []
+        for row in sorted(rows, key=lambda r: r['id']):
+            if row['match_type'] == "regex":
+                if validate_regex(row['trigger']) is None:
+                    group = f"_ar{row['id']}"
+                    patterns.append(f"(?P<{group}>{row['trigger']})")
+                    self._regex_rows[group] = row
+                else:
+                    print(f"⚠️ 自動応答 #{row['id']} の正規表現は使えないため無視します: {row['trigger']}")
+                continue
+            node = self._trie
+            for ch in _key(row['trigger']):
+                node = node[0].setdefault(ch, [{}, None, None])
+            slot = 2 if row['match_type'] == "prefix" else 1
+            if node[slot] is None:
+                node[slot] = row
+        self._regex = None
+        if patterns:
+            try:
+                self._regex = re.compile("|".join(patterns), re.IGNORECASE)
+            except re.error:
+                # 念のため: まとめて壊れるなら全件を個別判定にする (サーバー全体を止めない)
+                for row in self._regex_rows.values():
+                    self._add_fallback(row)
+                self._regex_rows = {}
+
+    def _add_fallback(self, row):
+        # 単体でも不正なパターンは読み飛ばす
+        try:
+            self._fallback.append((re.compile(row['trigger'], re.IGNORECASE), row))
+        except re.error:
+            pass
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def regex_count(self):
+        return sum(1 for row in self.rows.values() if row['match_type'] == "regex")
+
+    def match(self, content):
+        """一致した行 (なければ None)"""
+        node = self._trie
+        prefix = node[2]
+        for ch in _key(content):
+            node = node[0].get(ch)
+            if node is None:
+                break
+            if node[2] is not None:
+                prefix = node[2]
+        else:
+            if node[1] is not None:
+                return node[1]
+        if prefix is not None:
+            return prefix
+
+        content = content[:REGEX_SCAN_MAX]
+        if self._regex is not None:
+            m = self._regex.search(content)
+            if m:
+                for group, value in m.groupdict().items():
+                    if value is not None and group in self._regex_rows:
+                        return self._regex_rows[group]
+        for pattern, row in self._fallback:
+            if pattern.search(content):
+                return row
+        return None
+
+
+class AutoResponseCache:
+    """サーバーごとの ResponseIndex をメモリに保持するキャッシュ
+
+    初めてメッセージが来たときにそのサーバーの行を1回だけ読み込み、
+    トリガーが変わるまで (invalidate / NOTIFY) 作り直しません。
+    """
+
+    CHANNEL = "auto_responses_changed"
+
+    def __init__(self, db):
+        self.db = db
+        # {guild_id: ResponseIndex}
+        self.indexes = {}
+        # 読み込み中の重複クエリ防止 {guild_id: Task}
+        self._loading = {}
+
+    async def get(self, guild_id):
+        index = self.indexes.get(guild_id)
+        if index is not None:
+            return index
+        task = self._loading.get(guild_id)
+        if task is None:
+            task = self._loading[guild_id] = asyncio.create_task(self._load(guild_id))
+        return await asyncio.shield(task)
+
+    async def _load(self, guild_id):
+        try:
+            rows = await self.db.fetch("auto_responses.by_guild", guild_id)
+            index = ResponseIndex([dict(row) for row in rows])
+            # 読み込み中に invalidate されていたら保存しない (次回読み直す)
+            if self._loading.get(guild_id) is asyncio.current_task():
+                self.indexes[guild_id] = index
+            return index
+        finally:
+            if self._loading.get(guild_id) is asyncio.current_task():
+                del self._loading[guild_id]
+
+    async def invalidate(self, guild_id):
+        self.indexes.pop(guild_id, None)
+        self._loading.pop(guild_id, None)
+
+    async def clear(self):
+        self.indexes.clear()
+        self._loading.clear()
+
+    async def add(self, guild_id, trigger, response, match_type, creator_id):
+        row = await self.db.fetchrow("auto_responses.add", guild_id, trigger, response, match_type, creator_id)
+        await self.invalidate(guild_id)
+        return row
+
+    async def remove(self, guild_id, response_id):
+        row = await self.db.fetchrow("auto_responses.delete", guild_id, response_id)
+        await self.invalidate(guild_id)
+        return row
+
+    def start(self):
+        self.db.notify.subscribe(self.CHANNEL, self.invalidate, self.clear)
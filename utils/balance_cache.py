@@ -0,0 +1,176 @@
+import asyncio
+import contextlib
+import time
+import weakref
+from collections import OrderedDict
+
+
+class BalanceCache:
+    """users テーブルの残高を保持する Write-behind キャッシュ
+
+    get_user で読んだ行をLRUで保持し、update_money の差分はメモリ上で即時反映。
+    DBへは「一定間隔」または「未反映ユーザー数が閾値を超えた時」にまとめて書き戻します。
+    DB往復を伴う読み込み・条件付き更新はユーザー単位でロックし (user_lock)、
+    フラッシュはロック中のユーザーを飛ばし、書き込み中のユーザーを flushing で示します。
+    """
+
+    def __init__(self, flush_callback, max_size=10000, ttl=60.0, flush_interval=5.0, flush_threshold=500):
+        # flush_callback: {user_id: [cash, bank, debt]} を受け取りDBへ反映するコルーチン関数
+        self.flush_callback = flush_callback
+        self.max_size = max_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+
+        # 読み込み済みの行 {user_id: (読み込み時刻, dict)} (LRU順: 末尾が最新)
+        self.rows = OrderedDict()
+        # DB未反映の差分 {user_id: [cash, bank, debt]}
+        self.pending = {}
+        # フラッシュ同士を直列にするロック
+        self.lock = asyncio.Lock()
+        # ユーザーごとのロック (使われなくなったら自動で消える)
+        self._user_locks = weakref.WeakValueDictionary()
+        # 書き込み中のバッチに含まれるユーザーと、その完了通知
+        self.flushing = frozenset()
+        self._flush_done = asyncio.Event()
+        self._flush_done.set()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    @contextlib.asynccontextmanager
+    async def user_lock(self, user_id):
+        """1ユーザー分のDB往復を、同じユーザーの他の処理・書き込み中のフラッシュと排他にする"""
+        lock = self._user_locks.get(user_id)
+        if lock is None:
+            lock = self._user_locks[user_id] = asyncio.Lock()
+        async with lock:
+            # 書き込み中の差分はDBにもキャッシュの pending にも無いので、終わるまで待つ
+            while user_id in self.flushing:
+                await self._flush_done.wait()
+            yield
+
+    def _is_locked(self, user_id):
+        lock = self._user_locks.get(user_id)
+        return lock is not None and lock.locked()
+
+    # --- 読み取り ---
+
+    def get(self, user_id):
+        """キャッシュ済みの行をコピーで返す。未ロード・期限切れなら None"""
+        entry = self.rows.get(user_id)
+        if entry is None:
+            return None
+        loaded_at, row = entry
+        if time.monotonic() - loaded_at > self.ttl:
+            # 期限切れ (他プロセスでの変更を拾うため)。未反映差分は pending に残っているので捨てて良い
+            del self.rows[user_id]
+            return None
+        self.rows.move_to_end(user_id)
+        return dict(row)
+
+    def store(self, user_id, row):
+        """DBから読んだ行を登録。未反映の差分を上乗せした状態で保持する"""
+        row = dict(row)
+        delta = self.pending.get(user_id)
+        if delta:
+            row['cash'] += delta[0]
+            row['bank'] += delta[1]
+            row['debt'] += delta[2]
+        self.rows[user_id] = (time.monotonic(), row)
+        self.rows.move_to_end(user_id)
+        # LRU追い出し (差分は pending 側に残るので行を捨てても失われない)
+        while len(self.rows) > self.max_size:
+            self.rows.popitem(last=False)
+        return dict(row)
+
+    # --- 書き込み ---
+
+    def apply(self, user_id, cash=0, bank=0, debt=0):
+        """差分をメモリ上で反映し、書き戻し待ちに積む"""
+        entry = self.rows.get(user_id)
+        if entry is not None:
+            row = entry[1]
+            row['cash'] += cash
+            row['bank'] += bank
+            row['debt'] += debt
+
+        delta = self.pending.get(user_id)
+        if delta is None:
+            self.pending[user_id] = [cash, bank, debt]
+        else:
+            delta[0] += cash
+            delta[1] += bank
+            delta[2] += debt
+
+        if len(self.pending) >= self.flush_threshold:
+            self._wakeup.set()
+
+    def take(self, user_id):
+        """条件付き更新のSQLへ畳み込むため、ユーザーの未反映差分を取り出す"""
+        return self.pending.pop(user_id, [0, 0, 0])
+
+    def restore(self, user_id, delta):
+        """取り出した差分を書き戻し待ちへ戻す (その間に積まれた差分と合算)"""
+        if not any(delta):
+            return
+        pending = self.pending.setdefault(user_id, [0, 0, 0])
+        pending[0] += delta[0]
+        pending[1] += delta[1]
+        pending[2] += delta[2]
+
+    def invalidate(self, user_id):
+        """キャッシュ済みの行を破棄 (未反映差分は残る)"""
+        self.rows.pop(user_id, None)
+
+    # --- 書き戻し ---
+
+    async def flush(self):
+        """未反映の差分をまとめてDBへ書き戻す"""
+        async with self.lock:
+            if not self.pending:
+                return
+            # DB往復中のユーザーは次回に回す (その処理が差分を畳み込むかもしれないため)
+            batch = {uid: delta for uid, delta in self.pending.items() if not self._is_locked(uid)}
+            if not batch:
+                return
+            for user_id in batch:
+                del self.pending[user_id]
+            self.flushing = frozenset(batch)
+            self._flush_done = asyncio.Event()
+            try:
+                await self.flush_callback(batch)
+            except BaseException:
+                # 失敗した分は次回に持ち越し
+                for user_id, delta in batch.items():
+                    self.restore(user_id, delta)
+                raise
+            finally:
+                self.flushing = frozenset()
+                self._flush_done.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        """フラッシュタスクを止め、残りの差分を書き戻す (シャットダウン時)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"⚠️ 残高キャッシュの書き戻しに失敗: {e}")
@@ -0,0 +1,36 @@
+import asyncio
+
+
+async def run_bulk(targets, action, concurrency=5, progress=None, interval=2.0):
+    """targets の各要素に action(target) を同時実行数 concurrency で適用する
+
+    progress(done, total) は interval 秒ごとに呼ばれます (進捗表示用)。
+    戻り値は (成功したtargetのリスト, [(target, 例外), ...])。
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    succeeded = []
+    failed = []
+
+    async def worker(target):
+        async with semaphore:
+            try:
+                await action(target)
+                succeeded.append(target)
+            except Exception as e:
+                failed.append((target, e))
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await progress(len(succeeded) + len(failed), len(targets))
+            except Exception:
+                pass
+
+    reporter_task = asyncio.create_task(reporter()) if progress else None
+    try:
+        await asyncio.gather(*(worker(t) for t in targets))
+    finally:
+        if reporter_task:
+            reporter_task.cancel()
+    return succeeded, failed
@@ -0,0 +1,53 @@
+import os
+import discord
+
+# --- キャッシュプロファイル ---
+# CACHE_PROFILE=full (既定): 全 Intents・全メンバーをキャッシュし、起動時にチャンク取得
+# CACHE_PROFILE=lean       : プレゼンス無し・メンバーはボイス接続中のみキャッシュ・チャンク取得なし
+# 個別の値は CHUNK_GUILDS / MAX_MESSAGES / INTENT_PRESENCES / MEMBER_CACHE で上書きできます。
+
+PROFILES = {
+    "full": {"presences": True, "member_cache": "all", "chunk_guilds": True, "max_messages": 1000},
+    "lean": {"presences": False, "member_cache": "voice", "chunk_guilds": False, "max_messages": 200},
+}
+
+
+def _flag(name, default):
+    value = os.getenv(name)
+    return default if value is None else value.lower() in ("1", "true", "yes", "on")
+
+
+def cache_options():
+    """commands.Bot に渡す intents / member_cache_flags / chunk_guilds_at_startup / max_messages"""
+    profile_name = os.getenv("CACHE_PROFILE", "full")
+    if profile_name not in PROFILES:
+        print(f"⚠️ 不明な CACHE_PROFILE: {profile_name} (full を使用します)")
+        profile_name = "full"
+    profile = PROFILES[profile_name]
+
+    if profile_name == "full":
+        intents = discord.Intents.all()
+    else:
+        # メンバー参加 (Raid検知) と本文 (AutoMod・ゲーム) は常に必要
+        intents = discord.Intents.default()
+        intents.members = True
+        intents.message_content = True
+    intents.presences = _flag("INTENT_PRESENCES", profile["presences"])
+
+    member_cache = os.getenv("MEMBER_CACHE", profile["member_cache"])
+    if member_cache == "all":
+        member_cache_flags = discord.MemberCacheFlags.from_intents(intents)
+    elif member_cache == "voice":
+        # 音楽機能 (ボイスチャンネルの人数確認) に必要な分だけ
+        member_cache_flags = discord.MemberCacheFlags.none()
+        member_cache_flags.voice = True
+    else:
+        member_cache_flags = discord.MemberCacheFlags.none()
+
+    max_messages = int(os.getenv("MAX_MESSAGES", profile["max_messages"]))
+    return {
+        "intents": intents,
+        "member_cache_flags": member_cache_flags,
+        "chunk_guilds_at_startup": _flag("CHUNK_GUILDS", profile["chunk_guilds"]),
+        "max_messages": max_messages if max_messages > 0 else None,
+    }
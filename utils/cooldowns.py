@@ -0,0 +1,125 @@
+import asyncio
+import datetime
+import time
+
+from discord import app_commands
+
+# 永続化する列ごとのクールダウン秒数 (起動時の読み込み範囲に使う)
+# DB接続時 (コグ読み込み前) に load() するため、デコレータではなくここで静的に定義する
+PERSISTED = {
+    "last_work": 600,
+}
+
+
+def utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class CooldownManager:
+    """(ユーザー, コマンド) ごとのトークンバケット
+
+    判定はメモリ上だけで行い、拒否時にDBへは一切アクセスしません。
+    バケットはプロセスごとなので、column 付きのクールダウン (例: /s work → users.last_work) は
+    メモリで許可した後に claim() で最終使用時刻を条件付きで書き込み、
+    他のクラスタですでに使われていないかをDBで確定させます。起動時にまだ有効な分を読み込みます。
+    """
+
+    def __init__(self, db, sweep_interval=60.0):
+        self.db = db
+        self.sweep_interval = sweep_interval
+        # {(user_id, key): [残りトークン, 更新時刻(monotonic), per]}
+        self.buckets = {}
+        self._task = None
+
+    def hit(self, user_id, key, rate, per):
+        """1回分を消費。許可なら None、クールダウン中なら残り秒数を返す"""
+        now = time.monotonic()
+        bucket = self.buckets.get((user_id, key))
+        if bucket is None:
+            tokens = float(rate)
+        else:
+            tokens = min(float(rate), bucket[0] + (now - bucket[1]) * rate / per)
+
+        if tokens < 1.0:
+            return (1.0 - tokens) * per / rate
+
+        self.buckets[(user_id, key)] = [tokens - 1.0, now, per]
+        return None
+
+    async def claim(self, user_id, column, per):
+        """永続化列の使用をDBで確定する。許可なら None、他のプロセスで使用済みなら残り秒数を返す"""
+        now = utcnow()
+        row = await self.db.fetchrow(f"cooldowns.claim.{column}", user_id, now, now - datetime.timedelta(seconds=per))
+        if row is not None:
+            return None
+        row = await self.db.fetchrow(f"cooldowns.get.{column}", user_id)
+        elapsed = (now - row['used_at']).total_seconds() if row and row['used_at'] else 0.0
+        # 以降の拒否はメモリだけで返せるよう、DB上の使用時刻にバケットを合わせる
+        self.buckets[(user_id, column)] = [0.0, time.monotonic() - elapsed, per]
+        return max(per - elapsed, 0.0)
+
+    def reset(self, user_id, key):
+        self.buckets.pop((user_id, key), None)
+
+    def sweep(self):
+        """満タンまで回復したバケットを捨てる (無い場合と同じ扱いになるため)"""
+        now = time.monotonic()
+        expired = [k for k, (_, updated, per) in self.buckets.items() if now - updated >= per]
+        for k in expired:
+            del self.buckets[k]
+        return len(expired)
+
+    async def load(self):
+        """永続化列から、まだクールダウン中のユーザーを一括で読み込む"""
+        now = utcnow()
+        mono = time.monotonic()
+        for column, per in PERSISTED.items():
+            rows = await self.db.fetch(f"cooldowns.load.{column}", now - datetime.timedelta(seconds=per))
+            for row in rows:
+                elapsed = (now - row['used_at']).total_seconds()
+                # rate=1 の列のみ永続化するため、使用時点でトークン0として復元
+                self.buckets[(row['user_id'], column)] = [0.0, mono - elapsed, per]
+
+    async def start(self):
+        await self.load()
+        if self._task is None:
+            self._task = asyncio.create_task(self._sweep_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.sweep()
+
+
+def cooldown(rate, per, column=None):
+    """スラッシュコマンド用のクールダウン (per 秒あたり rate 回)
+
+    column を指定すると users の該当列 (last_daily / last_work / last_rob) に永続化し、
+    再起動後も引き継ぎ、クラスタ構成でも全プロセスで1回に数えます (rate=1 のみ)。
+    超過時は app_commands.CommandOnCooldown を送出します。
+    """
+    if column is not None and rate != 1:
+        raise ValueError(f"cooldown column {column!r} only supports rate=1")
+    if column is not None and per > PERSISTED.get(column, 0):
+        raise ValueError(f"cooldown column {column!r} must be listed in PERSISTED with at least {per}s")
+
+    async def predicate(interaction):
+        key = column or interaction.command.qualified_name
+        cooldowns = interaction.client.db.cooldowns
+        retry_after = cooldowns.hit(interaction.user.id, key, rate, per)
+        if retry_after is None and column is not None:
+            retry_after = await cooldowns.claim(interaction.user.id, column, per)
+        if retry_after is not None:
+            raise app_commands.CommandOnCooldown(app_commands.Cooldown(rate, per), retry_after)
+        return True
+
+    return app_commands.check(predicate)
@@ -1,114 +1,294 @@
 import asyncpg
+import contextlib
 import os
 import json
+import time
+from collections import deque
+from utils.auto_responses import AutoResponseCache
+from utils.balance_cache import BalanceCache
+from utils.cooldowns import CooldownManager
+from utils.guild_settings import AutomodConfigCache, GuildSettingsCache
+from utils.ledger import Ledger
+from utils.migrations import migrate
+from utils.notify import NotifyListener
+from utils.queries import QUERIES
+from utils.warning_store import WarningStore
 
 class Database:
     def __init__(self, db_url):
         self.db_url = db_url
         self.pool = None
 
+        # 接続プール設定 (未指定時は asyncpg のデフォルト値)
+        self.pool_options = {
+            "min_size": int(os.getenv("DB_POOL_MIN_SIZE", 10)),
+            "max_size": int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+            "statement_cache_size": int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100)),
+            "command_timeout": float(os.getenv("DB_COMMAND_TIMEOUT")) if os.getenv("DB_COMMAND_TIMEOUT") else None,
+            "max_inactive_connection_lifetime": float(os.getenv("DB_CONN_LIFETIME", 300)),
+        }
+        # プール接続のサーバーPID (NOTIFY の送信元が自プロセスか判定する)
+        self.backend_pids = set()
+
+        # プール統計用
+        self._waiters = 0
+        self._acquire_count = 0
+        self._acquire_times = deque(maxlen=1000)
+
+        # 他プロセスでの設定変更の受信 (GUILD_SETTINGS_LISTEN=0 で NOTIFY 受信を無効化)
+        self.notify = NotifyListener(
+            db_url, enabled=os.getenv("GUILD_SETTINGS_LISTEN", "1") != "0", own_pids=self.backend_pids
+        )
+        # サーバー設定キャッシュ
+        self.guild_settings = GuildSettingsCache(self)
+        self.automod_config = AutomodConfigCache(self)
+        # 自動応答の索引 (サーバーごとに初回のみ読み込み)
+        self.auto_responses = AutoResponseCache(self)
+        # 警告 (ユーザーごとの件数をキャッシュ)
+        self.warnings = WarningStore(self)
+
+        # コマンドのクールダウン (判定はメモリ、last_work 等の永続化列は許可時にDBで確定)
+        self.cooldowns = CooldownManager(self)
+
+        # 経済台帳 (お金の移動をバッファしてまとめて書き込む)
+        self.ledger = Ledger(
+            self,
+            flush_interval=float(os.getenv("LEDGER_FLUSH_INTERVAL", 5)),
+            flush_threshold=int(os.getenv("LEDGER_FLUSH_THRESHOLD", 1000)),
+        )
+
+        # 残高キャッシュ (BALANCE_CACHE_SIZE=0 で無効化し、毎回DBへ直接書き込む)
+        cache_size = int(os.getenv("BALANCE_CACHE_SIZE", 10000))
+        self.balances = None
+        if cache_size > 0:
+            self.balances = BalanceCache(
+                self._flush_balances,
+                max_size=cache_size,
+                ttl=float(os.getenv("BALANCE_CACHE_TTL", 60)),
+                flush_interval=float(os.getenv("BALANCE_FLUSH_INTERVAL", 5)),
+                flush_threshold=int(os.getenv("BALANCE_FLUSH_THRESHOLD", 500)),
+            )
+
     async def connect(self):
         try:
-            self.pool = await asyncpg.create_pool(self.db_url)
+            self.pool = await asyncpg.create_pool(self.db_url, init=self._init_connection, **self.pool_options)
             await self.initialize_tables()
+            await self.guild_settings.start()
+            await self.automod_config.start()
+            self.auto_responses.start()
+            self.warnings.start()
+            self.notify.start()
+            await self.cooldowns.start()
+            self.ledger.start()
+            if self.balances:
+                self.balances.start()
             print("✅ データベース接続成功")
         except Exception as e:
             print(f"❌ データベース接続エラー: {e}")
             raise e
 
+    async def close(self):
+        """未反映の残高を書き戻してから接続を閉じる"""
+        await self.notify.stop()
+        await self.cooldowns.close()
+        try:
+            await self.ledger.close()
+        except Exception as e:
+            print(f"❌ 台帳の書き込みエラー: {e}")
+        if self.balances:
+            try:
+                await self.balances.close()
+            except Exception as e:
+                print(f"❌ 残高の書き戻しエラー: {e}")
+        if self.pool:
+            await self.pool.close()
+
+    # --- 接続プール ---
+
+    async def _init_connection(self, conn):
+        # NOTIFY の送信元判定用にサーバーPIDを記録し、接続が閉じられたら外す
+        pid = conn.get_server_pid()
+        self.backend_pids.add(pid)
+        conn.add_termination_listener(lambda c: self.backend_pids.discard(pid))
+
+    @contextlib.asynccontextmanager
+    async def _acquire(self):
+        """プールから接続を取得 (待ち数・取得時間を記録)。asyncpg バックエンド内部専用"""
+        self._waiters += 1
+        start = time.perf_counter()
+        try:
+            conn = await self.pool.acquire()
+        finally:
+            self._waiters -= 1
+        self._acquire_count += 1
+        self._acquire_times.append(time.perf_counter() - start)
+        try:
+            yield conn
+        finally:
+            await self.pool.release(conn)
+
+    def pool_stats(self):
+        """接続プールの状態 (使用中・待機中・待ち数・取得レイテンシ)"""
+        if not self.pool:
+            return {}
+        times = sorted(self._acquire_times)
+        size = self.pool.get_size()
+        idle = self.pool.get_idle_size()
+        return {
+            "size": size,
+            "min_size": self.pool.get_min_size(),
+            "max_size": self.pool.get_max_size(),
+            "in_use": size - idle,
+            "idle": idle,
+            "waiters": self._waiters,
+            "acquires": self._acquire_count,
+            "acquire_avg_ms": round(sum(times) / len(times) * 1000, 3) if times else 0.0,
+            "acquire_p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))] * 1000, 3) if times else 0.0,
+            "acquire_max_ms": round(times[-1] * 1000, 3) if times else 0.0,
+        }
+
     async def initialize_tables(self):
-        """テーブル初期化。ここでdebtカラムなどを確実に作成します"""
-        async with self.pool.acquire() as conn:
-            # ユーザー経済データ
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id BIGINT PRIMARY KEY,
-                    cash BIGINT DEFAULT 0,
-                    bank BIGINT DEFAULT 0,
-                    debt BIGINT DEFAULT 0,
-                    job TEXT DEFAULT 'ニート',
-                    xp BIGINT DEFAULT 0,
-                    level INT DEFAULT 1,
-                    last_daily TIMESTAMP,
-                    last_work TIMESTAMP,
-                    last_rob TIMESTAMP
-                );
-            """)
-            
-            # サーバー設定 (AutoModなど)
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS guild_settings (
-                    guild_id BIGINT PRIMARY KEY,
-                    automod_enabled BOOLEAN DEFAULT FALSE,
-                    spam_filter_enabled BOOLEAN DEFAULT FALSE,
-                    bad_words TEXT DEFAULT '',
-                    log_channel_id BIGINT DEFAULT 0,
-                    verify_role_id BIGINT DEFAULT 0
-                );
-            """)
-
-            # 自動応答
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS auto_responses (
-                    id SERIAL PRIMARY KEY,
-                    guild_id BIGINT,
-                    trigger TEXT,
-                    response TEXT,
-                    creator_id BIGINT
-                );
-            """)
-            
-            # 警告管理
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS warnings (
-                    id SERIAL PRIMARY KEY,
-                    guild_id BIGINT,
-                    user_id BIGINT,
-                    reason TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    moderator_id BIGINT
-                );
-            """)
-
-            # AutoMod設定詳細
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS automod_config (
-                    guild_id BIGINT PRIMARY KEY,
-                    spam_threshold INT DEFAULT 10,
-                    mute_duration INT DEFAULT 60,
-                    ignored_channels TEXT DEFAULT '',
-                    ignored_roles TEXT DEFAULT ''
-                );
-            """)
+        """スキーマを最新化。適用済みならDDLは実行しません (utils/migrations.py)"""
+        async with self._acquire() as conn:
+            await migrate(conn)
 
     async def get_user(self, user_id):
-        async with self.pool.acquire() as conn:
-            row = await conn.fetchrow("SELECT * FROM users WHERE user_id = $1", user_id)
+        if not self.balances:
+            return await self._load_user(user_id)
+
+        row = self.balances.get(user_id)
+        if row is not None:
+            return row
+        # フラッシュ中の差分と二重計上しないよう、読み込みはユーザー単位のロック内で行う
+        async with self.balances.user_lock(user_id):
+            row = self.balances.get(user_id)
+            if row is None:
+                row = self.balances.store(user_id, await self._load_user(user_id))
+        return row
+
+    async def _load_user(self, user_id):
+        async with self._acquire() as conn:
+            row = await self._fetchrow(conn, "users.get", user_id)
             if not row:
-                await conn.execute("INSERT INTO users (user_id) VALUES ($1)", user_id)
-                return {"cash": 0, "bank": 0, "debt": 0, "job": "ニート", "xp": 0, "level": 1}
+                await self._fetchrow(conn, "users.create", user_id)
+                return {"user_id": user_id, "cash": 0, "bank": 0, "debt": 0, "job": "ニート", "xp": 0, "level": 1}
+            return dict(row)
+
+    async def update_money(self, user_id, cash=0, bank=0, debt=0, source="other", guild_id=None):
+        self.ledger.record(user_id, source, cash, bank, debt, guild_id=guild_id)
+        if self.balances:
+            # メモリ上で反映し、DBへはまとめて書き戻す
+            self.balances.apply(user_id, cash, bank, debt)
+            return
+
+        # Upsert logic
+        await self.execute("users.add_money", user_id, cash, bank, debt)
+
+    # --- 条件付き更新 (残高チェックと更新を1文で行う) ---
+
+    async def update_money_if(self, user_id, cash=0, bank=0, debt=0, min_cash=0, max_debt=None, source="other", guild_id=None):
+        """現金が min_cash 以上 (かつ借金が max_debt 以下) の場合のみ更新。更新後の行 or None"""
+        row = await self._update_user_if("users.update_money_if", user_id, cash, bank, debt, min_cash, max_debt)
+        if row is not None:
+            self.ledger.record(user_id, source, cash, bank, debt, guild_id=guild_id)
+        return row
+
+    async def repay_debt(self, user_id, amount, guild_id=None):
+        """借金を最大 amount 返済。現金が amount 以上かつ借金がある場合のみ。返済額は 'paid'"""
+        row = await self._update_user_if("users.repay_debt", user_id, amount)
+        if row is not None:
+            self.ledger.record(user_id, "repay", cash=-row['paid'], debt=-row['paid'], guild_id=guild_id)
+        return row
+
+    async def change_job(self, user_id, job, cost, guild_id=None):
+        """転職費用を支払えた場合のみ職業を変更"""
+        row = await self._update_user_if("users.change_job", user_id, job, cost)
+        if row is not None:
+            self.ledger.record(user_id, "job_change", cash=-cost, guild_id=guild_id)
+        return row
+
+    async def transfer(self, from_id, to_id, amount, guild_id=None):
+        """送金元の現金が足りる場合のみ、出金と入金を1トランザクション(1文)で行う"""
+        row = await self._update_user_if("users.transfer", from_id, to_id, amount)
+        if row is not None:
+            self.ledger.record(from_id, "transfer", cash=-amount, counterparty_id=to_id, guild_id=guild_id)
+            self.ledger.record(to_id, "transfer", cash=amount, counterparty_id=from_id, guild_id=guild_id)
+            if self.balances:
+                # 受取側はDB上で直接加算したので、キャッシュ済みの行は読み直させる
+                self.balances.invalidate(to_id)
+        return row
+
+    async def _update_user_if(self, query, user_id, *args):
+        if not self.balances:
+            row = await self._fetch_user_if(query, user_id, 0, 0, 0, *args)
+            return dict(row) if row else None
+
+        # 未反映差分をSQLへ畳み込み、DB上の値で判定する (同じユーザーの処理・フラッシュとは排他)
+        async with self.balances.user_lock(user_id):
+            delta = self.balances.take(user_id)
+            try:
+                row = await self._fetch_user_if(query, user_id, *delta, *args)
+            except BaseException:
+                self.balances.restore(user_id, delta)
+                raise
+            if row is None:
+                self.balances.restore(user_id, delta)
+                return None
+            return self.balances.store(user_id, row)
+
+    async def _fetch_user_if(self, query, user_id, *args):
+        async with self._acquire() as conn:
+            row = await self._fetchrow(conn, query, user_id, *args)
+            if row is None:
+                # 行がまだ無いだけの場合は作成して1度だけ再試行 (失敗時のみの追加コスト)
+                if await self._fetchrow(conn, "users.create", user_id):
+                    row = await self._fetchrow(conn, query, user_id, *args)
             return row
 
-    async def update_money(self, user_id, cash=0, bank=0, debt=0):
-        async with self.pool.acquire() as conn:
-            # Upsert logic
-            await conn.execute("""
-                INSERT INTO users (user_id, cash, bank, debt) VALUES ($1, $2, $3, $4)
-                ON CONFLICT (user_id) DO UPDATE 
-                SET cash = users.cash + $2, 
-                    bank = users.bank + $3,
-                    debt = users.debt + $4
-            """, user_id, cash, bank, debt)
-
-    # 汎用実行メソッド
+    async def _flush_balances(self, deltas):
+        """残高キャッシュの差分を1回のUPSERTでまとめて反映"""
+        user_ids = list(deltas)
+        await self.execute(
+            "users.add_money_batch",
+            user_ids,
+            [deltas[uid][0] for uid in user_ids],
+            [deltas[uid][1] for uid in user_ids],
+            [deltas[uid][2] for uid in user_ids],
+        )
+
+    async def copy_ledger(self, records):
+        """台帳レコードを COPY でまとめて書き込む (Ledger.flush から呼ばれる)"""
+        async with self._acquire() as conn:
+            await conn.copy_records_to_table("economy_ledger", records=records, columns=Ledger.COLUMNS)
+
+    # 汎用実行メソッド (query には QUERIES の名前か生のSQLを渡す)
     async def execute(self, query, *args):
-        async with self.pool.acquire() as conn:
-            return await conn.execute(query, *args)
+        async with self._acquire() as conn:
+            return await self._execute(conn, query, *args)
 
     async def fetch(self, query, *args):
-        async with self.pool.acquire() as conn:
-            return await conn.fetch(query, *args)
+        async with self._acquire() as conn:
+            return await self._fetch(conn, query, *args)
 
     async def fetchrow(self, query, *args):
-        async with self.pool.acquire() as conn:
-            return await conn.fetchrow(query, *args)
+        async with self._acquire() as conn:
+            return await self._fetchrow(conn, query, *args)
+
+    # prepare は asyncpg の接続ごとのステートメントキャッシュ (statement_cache_size) に任せる
+    # (PreparedStatement はプールへ返却すると使えなくなるため自前では保持しない)
+    async def _execute(self, conn, query, *args):
+        return await conn.execute(QUERIES.get(query, query), *args)
+
+    async def _fetch(self, conn, query, *args):
+        return await conn.fetch(QUERIES.get(query, query), *args)
+
+    async def _fetchrow(self, conn, query, *args):
+        return await conn.fetchrow(QUERIES.get(query, query), *args)
+
+
+def create_database(db_url):
+    """DATABASE_URL のスキームからストレージを選択 (postgres:// → Database, sqlite:/// → SQLiteDatabase)"""
+    if db_url and db_url.startswith("sqlite:"):
+        from utils.sqlite_database import SQLiteDatabase
+        return SQLiteDatabase(db_url)
+    return Database(db_url)
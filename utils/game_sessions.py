@@ -0,0 +1,54 @@
+import asyncio
+
+
+class SessionBusy(Exception):
+    """同じユーザーのゲームがすでに進行中"""
+
+
+class GameSessions:
+    """対話型ゲームの回答待ちを (channel_id, user_id) で索引するレジストリ
+
+    bot.wait_for は待機中の全 check を毎メッセージ実行しますが、
+    こちらは on_message から dict を1回引くだけで該当する待機者に届けます。
+    1ユーザーにつき同時に1つまでしか待機できません。
+    """
+
+    def __init__(self):
+        # {(channel_id, user_id): (Future, check)}
+        self.waiters = {}
+        # {user_id: (channel_id, user_id)}
+        self.users = {}
+
+    def __len__(self):
+        return len(self.waiters)
+
+    def is_active(self, user_id):
+        return user_id in self.users
+
+    async def wait(self, channel_id, user_id, check=None, timeout=10.0):
+        """該当チャンネルでの次の発言を待つ。時間切れは asyncio.TimeoutError"""
+        if user_id in self.users:
+            raise SessionBusy(user_id)
+        key = (channel_id, user_id)
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[key] = (future, check)
+        self.users[user_id] = key
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        finally:
+            # 時間切れ・キャンセル時も必ず登録を外す
+            if self.waiters.get(key, (None,))[0] is future:
+                del self.waiters[key]
+            if self.users.get(user_id) == key:
+                del self.users[user_id]
+
+    def dispatch(self, message):
+        """待機者がいればメッセージを渡して True"""
+        entry = self.waiters.get((message.channel.id, message.author.id))
+        if entry is None:
+            return False
+        future, check = entry
+        if future.done() or (check is not None and not check(message)):
+            return False
+        future.set_result(message)
+        return True
@@ -0,0 +1,71 @@
+class GuildSettingsCache:
+    """guild_settings の全行をメモリに保持するキャッシュ
+
+    起動時に一括で読み込み、以降の読み取り (on_message 等) はDBへ問い合わせません。
+    行が無いサーバーは「設定なし」としてそのまま扱われます (ネガティブキャッシュ)。
+    更新はコマンド側の put() と、DBトリガーからの NOTIFY で反映します (複数プロセス対応)。
+    """
+
+    TABLE = "guild_settings"
+    CHANNEL = "guild_settings_changed"
+
+    def __init__(self, db):
+        self.db = db
+        # {guild_id: dict}
+        self.settings = {}
+
+    def get(self, guild_id):
+        """設定の dict を返す。設定が無いサーバーは None"""
+        return self.settings.get(guild_id)
+
+    def put(self, row):
+        """書き込み結果 (RETURNING *) をそのまま反映"""
+        if row is not None:
+            self.settings[row['guild_id']] = self.prepare(dict(row))
+
+    def prepare(self, row):
+        """キャッシュに載せる前の前処理 (サブクラスで上書き)"""
+        return row
+
+    async def update(self, query, guild_id, *args):
+        """設定を書き込み、返ってきた行でキャッシュを更新する"""
+        row = await self.db.fetchrow(query, guild_id, *args)
+        self.put(row)
+        return row
+
+    async def load_all(self):
+        rows = await self.db.fetch(f"{self.TABLE}.all")
+        self.settings = {row['guild_id']: self.prepare(dict(row)) for row in rows}
+
+    async def refresh(self, guild_id):
+        row = await self.db.fetchrow(f"{self.TABLE}.get", guild_id)
+        if row is None:
+            self.settings.pop(guild_id, None)
+        else:
+            self.put(row)
+
+    async def start(self):
+        await self.load_all()
+        # 他プロセスでの変更は DBトリガーの NOTIFY で反映 (utils/notify.py)
+        self.db.notify.subscribe(self.CHANNEL, self.refresh, self.load_all)
+
+
+def parse_ids(text):
+    """カンマ区切りのID文字列 → frozenset"""
+    return frozenset(int(x) for x in (text or "").split(",") if x.strip().isdigit())
+
+
+class AutomodConfigCache(GuildSettingsCache):
+    """automod_config のキャッシュ
+
+    除外チャンネル・ロールは読み込み時に frozenset へ変換しておき、
+    on_message では本文を見る前に集合の包含チェックだけで判定します。
+    """
+
+    TABLE = "automod_config"
+    CHANNEL = "automod_config_changed"
+
+    def prepare(self, row):
+        row['ignored_channel_ids'] = parse_ids(row['ignored_channels'])
+        row['ignored_role_ids'] = parse_ids(row['ignored_roles'])
+        return row
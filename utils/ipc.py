@@ -0,0 +1,81 @@
+import asyncio
+import time
+import aiohttp
+from aiohttp import web
+
+
+class ClusterIPC:
+    """クラスタ間の軽量IPC (各クラスタの Web サーバー同士で HTTP 問い合わせ)
+
+    クラスタ N は base_port + N で待ち受け、/ipc/stats で自分の統計を返します。
+    totals() は全クラスタに問い合わせた合計を ttl 秒キャッシュして返します。
+    """
+
+    def __init__(self, bot, cluster_id=0, cluster_count=1, base_port=8000, host="127.0.0.1", secret="", ttl=30.0):
+        self.bot = bot
+        self.cluster_id = cluster_id
+        self.cluster_count = cluster_count
+        self.base_port = base_port
+        self.host = host
+        self.secret = secret
+        self.ttl = ttl
+        self._session = None
+        self._cache = None
+        self._cached_at = 0.0
+
+    @property
+    def port(self):
+        return self.base_port + self.cluster_id
+
+    def local_stats(self):
+        return {
+            "cluster_id": self.cluster_id,
+            "shards": sorted(self.bot.shards) if getattr(self.bot, "shards", None) else [],
+            "guilds": len(self.bot.guilds),
+            "members": sum(g.member_count or 0 for g in self.bot.guilds),
+            "latency": self.bot.latency,
+        }
+
+    async def totals(self):
+        """全クラスタ合計のサーバー数・メンバー数"""
+        if self.cluster_count <= 1:
+            stats = self.local_stats()
+            return {"guilds": stats["guilds"], "members": stats["members"], "clusters": 1, "cluster_count": 1}
+
+        if self._cache and time.monotonic() - self._cached_at < self.ttl:
+            return self._cache
+
+        results = await asyncio.gather(*(self._fetch_stats(i) for i in range(self.cluster_count)))
+        alive = [r for r in results if r]
+        self._cache = {
+            "guilds": sum(r["guilds"] for r in alive),
+            "members": sum(r["members"] for r in alive),
+            "clusters": len(alive),
+            "cluster_count": self.cluster_count,
+        }
+        self._cached_at = time.monotonic()
+        return self._cache
+
+    async def _fetch_stats(self, cluster_id):
+        if cluster_id == self.cluster_id:
+            return self.local_stats()
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=2))
+        try:
+            url = f"http://{self.host}:{self.base_port + cluster_id}/ipc/stats"
+            async with self._session.get(url, headers={"X-IPC-Token": self.secret}) as resp:
+                if resp.status != 200:
+                    return None
+                return await resp.json()
+        except Exception:
+            return None
+
+    async def handle_stats(self, request):
+        if request.headers.get("X-IPC-Token", "") != self.secret:
+            return web.Response(status=403)
+        return web.json_response(self.local_stats())
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
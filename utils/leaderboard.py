@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+
+class Leaderboard:
+    """純資産ランキングのキャッシュ
+
+    上位 size 件を ttl 秒ごとにバックグラウンドで再取得し、/s ranking はメモリから返します。
+    キャッシュ範囲より後ろのページだけはDBへ問い合わせます (純資産の式インデックスを使用)。
+    """
+
+    def __init__(self, bot, size=100, ttl=30.0, name_ttl=600.0):
+        self.bot = bot
+        self.size = size
+        self.ttl = ttl
+        self.name_ttl = name_ttl
+
+        # 上位の行 [(user_id, net_worth), ...]
+        self.entries = []
+        self.updated_at = 0.0
+        # 表示名キャッシュ {user_id: (有効期限, 名前)}
+        self.names = {}
+        # fetch_user の同時実行数を抑える (APIレート制限対策)
+        self._fetch_sem = asyncio.Semaphore(5)
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def refresh(self):
+        rows = await self.bot.db.fetch("users.top_net_worth", self.size, 0)
+        self.entries = [(row['user_id'], row['net_worth']) for row in rows]
+        self.updated_at = time.monotonic()
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh()
+                now = time.monotonic()
+                self.names = {k: v for k, v in self.names.items() if v[0] > now}
+                # 上位の名前も先に解決しておく
+                await self.resolve_names([user_id for user_id, _ in self.entries])
+            except Exception as e:
+                print(f"⚠️ ランキング更新エラー: {e}")
+            await asyncio.sleep(self.ttl)
+
+    async def page(self, page, per_page=10):
+        """指定ページの [(順位, user_id, net_worth), ...] を返す"""
+        start = (page - 1) * per_page
+        if not self.updated_at:
+            # 起動直後でまだ一度も取得していない場合のみ同期的に取得
+            await self.refresh()
+
+        if start + per_page <= self.size:
+            rows = self.entries[start:start + per_page]
+        else:
+            records = await self.bot.db.fetch("users.top_net_worth", per_page, start)
+            rows = [(row['user_id'], row['net_worth']) for row in records]
+        return [(start + i, user_id, net_worth) for i, (user_id, net_worth) in enumerate(rows, 1)]
+
+    async def resolve_names(self, user_ids):
+        """user_id -> 表示名 をまとめて解決 (メモリキャッシュ → Botキャッシュ → API の順)"""
+        now = time.monotonic()
+        result = {}
+        missing = []
+        for user_id in user_ids:
+            cached = self.names.get(user_id)
+            if cached and cached[0] > now:
+                result[user_id] = cached[1]
+                continue
+            user = self.bot.get_user(user_id)
+            if user:
+                result[user_id] = self._remember(user_id, user.display_name, now)
+            else:
+                missing.append(user_id)
+
+        if missing:
+            fetched = await asyncio.gather(*(self._fetch_name(user_id) for user_id in missing))
+            for user_id, name in zip(missing, fetched):
+                if name is None:
+                    # 取得できないユーザーは短めにキャッシュしてID表示
+                    self.names[user_id] = (now + 60, f"User ID: {user_id}")
+                    result[user_id] = f"User ID: {user_id}"
+                else:
+                    result[user_id] = self._remember(user_id, name, now)
+        return result
+
+    def _remember(self, user_id, name, now):
+        self.names[user_id] = (now + self.name_ttl, name)
+        return name
+
+    async def _fetch_name(self, user_id):
+        async with self._fetch_sem:
+            try:
+                user = await self.bot.fetch_user(user_id)
+                return user.display_name
+            except Exception:
+                return None
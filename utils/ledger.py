@@ -0,0 +1,91 @@
+import asyncio
+import datetime
+
+
+class Ledger:
+    """経済イベントの追記専用台帳 (economy_ledger)
+
+    record() はメモリ上のバッファに積むだけで、DBへは一定間隔・一定件数ごとに
+    COPY (copy_records_to_table) でまとめて書き込みます。コマンド側の往復は増えません。
+    """
+
+    COLUMNS = ("user_id", "cash", "bank", "debt", "source", "counterparty_id", "guild_id", "created_at")
+
+    def __init__(self, db, flush_interval=5.0, flush_threshold=1000, max_buffer=100000):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        # DB障害時にメモリを食い潰さないための上限 (超えたら古いものから捨てる)
+        self.max_buffer = max_buffer
+        self.buffer = []
+        self.dropped = 0
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def record(self, user_id, source, cash=0, bank=0, debt=0, counterparty_id=None, guild_id=None):
+        """1件のお金の移動を記録 (ノンブロッキング)"""
+        if not (cash or bank or debt):
+            return
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        self.buffer.append((user_id, cash, bank, debt, source, counterparty_id, guild_id, now))
+        if len(self.buffer) > self.max_buffer:
+            overflow = len(self.buffer) - self.max_buffer
+            del self.buffer[:overflow]
+            self.dropped += overflow
+        if len(self.buffer) >= self.flush_threshold:
+            self._wakeup.set()
+
+    async def flush(self):
+        async with self._lock:
+            if not self.buffer:
+                return
+            records, self.buffer = self.buffer, []
+            try:
+                await self.db.copy_ledger(records)
+            except BaseException:
+                # 失敗分は次回に持ち越し (新しく積まれた分より前に戻す)
+                self.buffer[:0] = records
+                raise
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"⚠️ 台帳の書き込みに失敗 (バッファ: {len(self.buffer)}件): {e}")
+
+    # --- 参照API ---
+
+    async def history(self, user_id, limit=20, before_id=None):
+        """ユーザーの履歴を新しい順に返す。before_id で続きのページを取得"""
+        # 未書き込みの分も含めて返すため、先にバッファを流す
+        if self.buffer:
+            await self.flush()
+        return await self.db.fetch("ledger.history", user_id, before_id, limit)
+
+    async def totals_by_source(self, since=None):
+        """source (slot, work, transfer ...) ごとの件数と増減の合計。since 以降のみ"""
+        if self.buffer:
+            await self.flush()
+        since = since or datetime.datetime(1970, 1, 1)
+        return await self.db.fetch("ledger.totals_by_source", since)
@@ -0,0 +1,317 @@
+import asyncpg
+import sqlite3
+
+# --- スキーママイグレーション ---
+# (バージョン, 説明, [SQL, ...]) の形で末尾に追加していきます。
+# 適用済みのマイグレーションは書き換えず、変更は必ず新しいバージョンとして追加してください。
+
+MIGRATIONS = [
+    (1, "初期テーブル", [
+        # ユーザー経済データ
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            cash BIGINT DEFAULT 0,
+            bank BIGINT DEFAULT 0,
+            debt BIGINT DEFAULT 0,
+            job TEXT DEFAULT 'ニート',
+            xp BIGINT DEFAULT 0,
+            level INT DEFAULT 1,
+            last_daily TIMESTAMP,
+            last_work TIMESTAMP,
+            last_rob TIMESTAMP
+        );
+        """,
+        # サーバー設定 (AutoModなど)
+        """
+        CREATE TABLE IF NOT EXISTS guild_settings (
+            guild_id BIGINT PRIMARY KEY,
+            automod_enabled BOOLEAN DEFAULT FALSE,
+            spam_filter_enabled BOOLEAN DEFAULT FALSE,
+            bad_words TEXT DEFAULT '',
+            log_channel_id BIGINT DEFAULT 0,
+            verify_role_id BIGINT DEFAULT 0
+        );
+        """,
+        # 自動応答
+        """
+        CREATE TABLE IF NOT EXISTS auto_responses (
+            id SERIAL PRIMARY KEY,
+            guild_id BIGINT,
+            trigger TEXT,
+            response TEXT,
+            creator_id BIGINT
+        );
+        """,
+        # 警告管理
+        """
+        CREATE TABLE IF NOT EXISTS warnings (
+            id SERIAL PRIMARY KEY,
+            guild_id BIGINT,
+            user_id BIGINT,
+            reason TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            moderator_id BIGINT
+        );
+        """,
+        # AutoMod設定詳細
+        """
+        CREATE TABLE IF NOT EXISTS automod_config (
+            guild_id BIGINT PRIMARY KEY,
+            spam_threshold INT DEFAULT 10,
+            mute_duration INT DEFAULT 60,
+            ignored_channels TEXT DEFAULT '',
+            ignored_roles TEXT DEFAULT ''
+        );
+        """,
+    ]),
+    (2, "ホットパス用インデックス", [
+        # ランキング用: 純資産の式インデックス
+        "CREATE INDEX IF NOT EXISTS idx_users_net_worth ON users ((cash + bank - debt) DESC, user_id);",
+        # 警告履歴: ユーザー別の一覧・件数 (id順のページングにも使用)
+        "CREATE INDEX IF NOT EXISTS idx_warnings_guild_user ON warnings (guild_id, user_id, id);",
+        # 自動応答: サーバー別の読み込み
+        "CREATE INDEX IF NOT EXISTS idx_auto_responses_guild ON auto_responses (guild_id);",
+    ]),
+    (3, "設定変更の NOTIFY トリガー", [
+        # 引数 (TG_ARGV[0]) のチャンネルへ guild_id を通知する汎用トリガー関数
+        """
+        CREATE OR REPLACE FUNCTION notify_guild_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                PERFORM pg_notify(TG_ARGV[0], OLD.guild_id::text);
+            ELSE
+                PERFORM pg_notify(TG_ARGV[0], NEW.guild_id::text);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        "DROP TRIGGER IF EXISTS trg_guild_settings_notify ON guild_settings;",
+        """
+        CREATE TRIGGER trg_guild_settings_notify
+        AFTER INSERT OR UPDATE OR DELETE ON guild_settings
+        FOR EACH ROW EXECUTE PROCEDURE notify_guild_change('guild_settings_changed');
+        """,
+    ]),
+    (4, "経済台帳", [
+        """
+        CREATE TABLE IF NOT EXISTS economy_ledger (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            cash BIGINT NOT NULL DEFAULT 0,
+            bank BIGINT NOT NULL DEFAULT 0,
+            debt BIGINT NOT NULL DEFAULT 0,
+            source TEXT NOT NULL,
+            counterparty_id BIGINT,
+            guild_id BIGINT,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        # ユーザー別履歴 (id の降順ページング)
+        "CREATE INDEX IF NOT EXISTS idx_ledger_user ON economy_ledger (user_id, id);",
+        # 期間集計
+        "CREATE INDEX IF NOT EXISTS idx_ledger_created ON economy_ledger (created_at);",
+    ]),
+    (5, "自動応答のマッチ方式", [
+        # exact (完全一致) / prefix (前方一致) / regex (正規表現)
+        "ALTER TABLE auto_responses ADD COLUMN IF NOT EXISTS match_type TEXT NOT NULL DEFAULT 'exact';",
+        "DROP TRIGGER IF EXISTS trg_auto_responses_notify ON auto_responses;",
+        """
+        CREATE TRIGGER trg_auto_responses_notify
+        AFTER INSERT OR UPDATE OR DELETE ON auto_responses
+        FOR EACH ROW EXECUTE PROCEDURE notify_guild_change('auto_responses_changed');
+        """,
+    ]),
+    (6, "警告の NOTIFY トリガー", [
+        "DROP TRIGGER IF EXISTS trg_warnings_notify ON warnings;",
+        """
+        CREATE TRIGGER trg_warnings_notify
+        AFTER INSERT OR UPDATE OR DELETE ON warnings
+        FOR EACH ROW EXECUTE PROCEDURE notify_guild_change('warnings_changed');
+        """,
+    ]),
+    (7, "AutoMod詳細設定の NOTIFY トリガー", [
+        "DROP TRIGGER IF EXISTS trg_automod_config_notify ON automod_config;",
+        """
+        CREATE TRIGGER trg_automod_config_notify
+        AFTER INSERT OR UPDATE OR DELETE ON automod_config
+        FOR EACH ROW EXECUTE PROCEDURE notify_guild_change('automod_config_changed');
+        """,
+    ]),
+    (8, "レイドのロックダウン状態", [
+        # 再起動後も元の認証レベルに戻せるよう保存する (release_at が NULL なら手動解除のみ)
+        """
+        CREATE TABLE IF NOT EXISTS raid_lockdowns (
+            guild_id BIGINT PRIMARY KEY,
+            previous_level INT NOT NULL,
+            release_at TIMESTAMP
+        );
+        """,
+    ]),
+]
+
+# SQLite バックエンド用 (バージョン番号は MIGRATIONS と揃える)
+SQLITE_MIGRATIONS = [
+    (1, "初期テーブル", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            cash BIGINT DEFAULT 0,
+            bank BIGINT DEFAULT 0,
+            debt BIGINT DEFAULT 0,
+            job TEXT DEFAULT 'ニート',
+            xp BIGINT DEFAULT 0,
+            level INT DEFAULT 1,
+            last_daily TIMESTAMP,
+            last_work TIMESTAMP,
+            last_rob TIMESTAMP
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS guild_settings (
+            guild_id BIGINT PRIMARY KEY,
+            automod_enabled BOOLEAN DEFAULT FALSE,
+            spam_filter_enabled BOOLEAN DEFAULT FALSE,
+            bad_words TEXT DEFAULT '',
+            log_channel_id BIGINT DEFAULT 0,
+            verify_role_id BIGINT DEFAULT 0
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS auto_responses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id BIGINT,
+            trigger TEXT,
+            response TEXT,
+            creator_id BIGINT
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS warnings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id BIGINT,
+            user_id BIGINT,
+            reason TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            moderator_id BIGINT
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS automod_config (
+            guild_id BIGINT PRIMARY KEY,
+            spam_threshold INT DEFAULT 10,
+            mute_duration INT DEFAULT 60,
+            ignored_channels TEXT DEFAULT '',
+            ignored_roles TEXT DEFAULT ''
+        );
+        """,
+    ]),
+    (2, "ホットパス用インデックス", [
+        "CREATE INDEX IF NOT EXISTS idx_users_net_worth ON users ((cash + bank - debt) DESC, user_id);",
+        "CREATE INDEX IF NOT EXISTS idx_warnings_guild_user ON warnings (guild_id, user_id, id);",
+        "CREATE INDEX IF NOT EXISTS idx_auto_responses_guild ON auto_responses (guild_id);",
+    ]),
+    # SQLite は単一プロセス前提のため NOTIFY は不要
+    (3, "設定変更の NOTIFY トリガー", []),
+    (4, "経済台帳", [
+        """
+        CREATE TABLE IF NOT EXISTS economy_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id BIGINT NOT NULL,
+            cash BIGINT NOT NULL DEFAULT 0,
+            bank BIGINT NOT NULL DEFAULT 0,
+            debt BIGINT NOT NULL DEFAULT 0,
+            source TEXT NOT NULL,
+            counterparty_id BIGINT,
+            guild_id BIGINT,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_ledger_user ON economy_ledger (user_id, id);",
+        "CREATE INDEX IF NOT EXISTS idx_ledger_created ON economy_ledger (created_at);",
+    ]),
+    (5, "自動応答のマッチ方式", [
+        "ALTER TABLE auto_responses ADD COLUMN match_type TEXT NOT NULL DEFAULT 'exact';",
+    ]),
+    (6, "警告の NOTIFY トリガー", []),
+    (7, "AutoMod詳細設定の NOTIFY トリガー", []),
+    (8, "レイドのロックダウン状態", [
+        """
+        CREATE TABLE IF NOT EXISTS raid_lockdowns (
+            guild_id BIGINT PRIMARY KEY,
+            previous_level INT NOT NULL,
+            release_at TIMESTAMP
+        );
+        """,
+    ]),
+]
+
+# 複数プロセスが同時に起動してもマイグレーションが1度だけ走るようにするロックキー
+MIGRATION_LOCK_KEY = 0x52554D49  # "RUMI"
+
+
+async def current_version(conn):
+    try:
+        return await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    except asyncpg.UndefinedTableError:
+        return 0
+
+
+async def migrate(conn):
+    """未適用のマイグレーションを順に適用する。最新なら SELECT 1回だけで終わる"""
+    latest = MIGRATIONS[-1][0]
+    if await current_version(conn) >= latest:
+        return
+
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", MIGRATION_LOCK_KEY)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INT PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        # ロック待ちの間に他プロセスが適用している可能性があるので再確認
+        version = await current_version(conn)
+        for number, description, statements in MIGRATIONS:
+            if number <= version:
+                continue
+            for sql in statements:
+                await conn.execute(sql)
+            await conn.execute(
+                "INSERT INTO schema_version (version, description) VALUES ($1, $2)", number, description
+            )
+            print(f"✅ スキーマを v{number} に更新: {description}")
+
+
+def migrate_sqlite(conn):
+    """SQLite 版の migrate。isolation_level=None (自動コミット) の接続を渡すこと"""
+    try:
+        version = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+    except sqlite3.OperationalError:
+        version = 0
+    if version >= SQLITE_MIGRATIONS[-1][0]:
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INT PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        for number, description, statements in SQLITE_MIGRATIONS:
+            if number <= version:
+                continue
+            for sql in statements:
+                conn.execute(sql)
+            conn.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)", (number, description))
+            print(f"✅ スキーマを v{number} に更新: {description}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
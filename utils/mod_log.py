@@ -0,0 +1,173 @@
+import asyncio
+from collections import deque
+
+import discord
+
+WEBHOOK_NAME = "Rumia Log"
+
+
+class ModLogDispatcher:
+    """サーバーごとのログ送信キュー
+
+    log() は Embed をキューに積むだけで、送信はバックグラウンドでまとめて行います。
+    1メッセージに最大10件の Embed を詰め、1サーバーあたり flush_interval 秒ごとに
+    max_messages 通までしか送らないため、荒らしや一括削除でもAPI呼び出し数は一定です。
+    キューが max_queue 件を超えると古いものから捨て、件数を次の送信で通知します。
+    送信に失敗した分はキューの先頭に戻し、MAX_RETRIES 回失敗したら捨てます。
+    サーバー同士は最大 concurrency 件を並行して送るため、レート制限で待たされている
+    サーバーがあっても他のサーバーのログは遅れません。
+    """
+
+    EMBEDS_PER_MESSAGE = 10
+    # 1メッセージ内の Embed 合計文字数の上限
+    MAX_CHARS = 6000
+    # 同じバッチの再送回数の上限 (5xx・レート制限など一時的なエラーのみ再送)
+    MAX_RETRIES = 3
+
+    def __init__(self, bot, flush_interval=2.0, max_messages=1, max_queue=200, use_webhook=False, concurrency=8):
+        self.bot = bot
+        self.flush_interval = flush_interval
+        self.max_messages = max_messages
+        self.max_queue = max_queue
+        self.use_webhook = use_webhook
+        self.queues = {}
+        self.dropped = {}
+        # 先頭バッチの連続失敗回数 {guild_id: 回数}
+        self.retries = {}
+        # {channel_id: Webhook}
+        self.webhooks = {}
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def log(self, guild_id, channel_id, embed):
+        """ログを1件積む (ノンブロッキング)"""
+        queue = self.queues.get(guild_id)
+        if queue is None:
+            queue = self.queues[guild_id] = deque()
+        queue.append((channel_id, embed))
+        if len(queue) > self.max_queue:
+            queue.popleft()
+            self.dropped[guild_id] = self.dropped.get(guild_id, 0) + 1
+        self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # 停止時は残りを全部送る
+        while any(self.queues.values()):
+            await self.flush(max_messages=None)
+
+    async def _flush_loop(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"⚠️ ログ送信エラー: {e}")
+            # 次の送信まで待つ (この間に届いたログは次回まとめて送る)
+            await asyncio.sleep(self.flush_interval)
+            if any(self.queues.values()):
+                self._wakeup.set()
+
+    async def flush(self, max_messages=...):
+        max_messages = self.max_messages if max_messages is ... else max_messages
+        await asyncio.gather(*(self._flush_guild_safe(guild_id, max_messages) for guild_id in list(self.queues)))
+
+    async def _flush_guild_safe(self, guild_id, max_messages):
+        async with self.semaphore:
+            try:
+                await self._flush_guild(guild_id, max_messages)
+            except Exception as e:
+                # 1サーバーの失敗で他のサーバーのログを止めない
+                print(f"⚠️ ログ送信エラー (guild {guild_id}): {e}")
+
+    def _take_batch(self, queue):
+        """同じチャンネル宛の Embed を先頭から最大10件 (文字数上限内) 取り出す"""
+        channel_id = queue[0][0]
+        embeds = []
+        chars = 0
+        while queue and len(embeds) < self.EMBEDS_PER_MESSAGE and queue[0][0] == channel_id:
+            size = len(queue[0][1])
+            if embeds and chars + size > self.MAX_CHARS:
+                break
+            embeds.append(queue.popleft()[1])
+            chars += size
+        return channel_id, embeds
+
+    async def _flush_guild(self, guild_id, max_messages):
+        queue = self.queues.get(guild_id)
+        sent = 0
+        while queue and (max_messages is None or sent < max_messages):
+            channel_id, embeds = self._take_batch(queue)
+            dropped = self.dropped.pop(guild_id, 0)
+            batch = embeds
+            if dropped:
+                if len(embeds) == self.EMBEDS_PER_MESSAGE:
+                    queue.appendleft((channel_id, embeds.pop()))
+                batch = embeds + [discord.Embed(description=f"⚠️ ログが多すぎる・送信に失敗したため {dropped}件を省略しました。", color=0x95a5a6)]
+            try:
+                await self._send(channel_id, batch)
+            except discord.HTTPException as e:
+                retries = self.retries.get(guild_id, 0) + 1
+                # 4xx (不正なEmbed等) は何度送っても失敗するので再送しない
+                temporary = e.status >= 500 or e.status == 429
+                if temporary and retries < self.MAX_RETRIES:
+                    self.retries[guild_id] = retries
+                    queue.extendleft((channel_id, embed) for embed in reversed(embeds))
+                    if dropped:
+                        self.dropped[guild_id] = self.dropped.get(guild_id, 0) + dropped
+                else:
+                    self.retries.pop(guild_id, None)
+                    self.dropped[guild_id] = self.dropped.get(guild_id, 0) + dropped + len(embeds)
+                    print(f"⚠️ ログ送信に失敗したため {len(embeds)}件を破棄 (guild {guild_id}): {e}")
+                # このサーバーは次の周期に回す
+                break
+            self.retries.pop(guild_id, None)
+            sent += 1
+        if not queue:
+            self.queues.pop(guild_id, None)
+
+    async def _send(self, channel_id, embeds):
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            return
+        try:
+            if self.use_webhook:
+                webhook = await self._get_webhook(channel)
+                if webhook is not None:
+                    try:
+                        await webhook.send(embeds=embeds, username=WEBHOOK_NAME)
+                        return
+                    except discord.NotFound:
+                        # 削除された Webhook はキャッシュから外して通常送信
+                        self.webhooks.pop(channel_id, None)
+            await channel.send(embeds=embeds)
+        except discord.Forbidden:
+            pass
+
+    async def _get_webhook(self, channel):
+        webhook = self.webhooks.get(channel.id)
+        if webhook is not None:
+            return webhook
+        try:
+            for hook in await channel.webhooks():
+                if hook.name == WEBHOOK_NAME and hook.user == self.bot.user:
+                    webhook = hook
+                    break
+            else:
+                webhook = await channel.create_webhook(name=WEBHOOK_NAME)
+        except (discord.Forbidden, discord.HTTPException):
+            return None
+        self.webhooks[channel.id] = webhook
+        return webhook
@@ -0,0 +1,309 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+
+import discord
+
+from utils.audio_cache import cache_key
+from utils.constants import COLOR_MAIN
+
+# --- FFmpeg 設定 (再接続オプションで安定化) ---
+FFMPEG_BEFORE_OPTIONS = '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
+
+# MUSIC_OPUS=1 (既定): ffmpeg に Opus までエンコードさせ、Python 側の音量計算と再エンコードを省く
+# 音量は ffmpeg の volume フィルタで掛けるため、変更時は現在位置からソースを作り直します
+# MUSIC_OPUS=0: 従来どおり PCM で受け取り PCMVolumeTransformer で音量を変える
+MUSIC_OPUS = os.getenv("MUSIC_OPUS", "1").lower() in ("1", "true", "yes", "on")
+# デコードせずにコピーできる Opus のコンテナ
+OPUS_PASSTHROUGH_EXTS = ("webm", "opus", "ogg")
+# 既定の音量 (%)。そのままコピーできるのは 100% の時だけなので、Opus モードでは 100 を既定にする
+# (100 以外にすると全曲 ffmpeg でデコード・音量調整・再エンコードされます)
+DEFAULT_VOLUME = int(os.getenv("MUSIC_DEFAULT_VOLUME", 100 if MUSIC_OPUS else 50))
+
+LOOP_MODES = {"off": "オフ", "track": "1曲", "queue": "キュー全体"}
+
+
+class Track:
+    """キューに積む曲の情報 (オーディオソースは再生直前に作る)
+
+    stream_url は期限付きのため保持せず、再生直前に Extractor で解決します
+    (先読み済みならキャッシュから即座に返ります)。
+    """
+
+    __slots__ = ("query", "title", "duration", "requester_id", "cache_key")
+
+    def __init__(self, query, title, duration=None, requester_id=None, cache_key=None):
+        # 再解決用のクエリ (動画ページのURL)
+        self.query = query
+        self.title = title
+        self.duration = duration
+        self.requester_id = requester_id
+        # ディスクキャッシュのキー (utils/audio_cache.cache_key)
+        self.cache_key = cache_key
+
+    @classmethod
+    def from_info(cls, info, requester_id=None):
+        return cls(
+            info.get('webpage_url') or info['url'], info.get('title') or 'Unknown Title',
+            info.get('duration'), requester_id, cache_key(info),
+        )
+
+
+def format_duration(seconds):
+    """秒を 1:02:03 / 2:03 の形式にする"""
+    if seconds is None:
+        return "LIVE"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}" if hours else f"{minutes}:{seconds:02}"
+
+
+def parse_position(text):
+    """'90' / '1:30' / '1:02:03' を秒に変換する (不正なら None)"""
+    try:
+        parts = [float(p) for p in text.strip().split(":")]
+    except ValueError:
+        return None
+    if not 1 <= len(parts) <= 3 or any(p < 0 for p in parts):
+        return None
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + part
+    return seconds
+
+
+def create_source(info, volume, offset=0.0):
+    """再生直前に FFmpeg のオーディオソースを作る (キューに積んでいる間はプロセスを起動しない)"""
+    # ディスクキャッシュのファイルなら再接続オプションは不要
+    before_options = '' if info.get('local') else FFMPEG_BEFORE_OPTIONS
+    if offset > 0:
+        before_options += f" -ss {offset:.2f}"
+    before_options = before_options.strip()
+
+    if not MUSIC_OPUS:
+        source = discord.PCMVolumeTransformer(
+            discord.FFmpegPCMAudio(info['url'], before_options=before_options, options='-vn')
+        )
+        source.volume = volume
+        return source
+
+    if volume == 1.0 and info.get('acodec') == 'opus' and info.get('ext') in OPUS_PASSTHROUGH_EXTS:
+        # 元が Opus で音量も等倍ならデコードせずそのまま流す (codec="opus" で -c:a copy)
+        return discord.FFmpegOpusAudio(info['url'], codec="opus", before_options=before_options, options='-vn')
+    return discord.FFmpegOpusAudio(
+        info['url'], before_options=before_options, options=f'-vn -filter:a volume={volume:.2f}'
+    )
+
+
+class GuildPlayer:
+    """サーバーごとの再生キューと再生状態
+
+    専用のタスクがキューを持ち、1曲ずつ解決・再生して終了を待ちます。
+    状態の変更はすべてイベントループ上で行い、音声スレッドからの再生終了は
+    call_soon_threadsafe でイベントを立てるだけなので、コマンドと競合しません。
+    """
+
+    __slots__ = (
+        "guild", "extractor", "audio_cache", "loop", "queue", "loop_mode", "volume", "channel",
+        "current", "info", "started", "offset", "import_task", "_wake", "_ended", "_end_reason", "_task",
+    )
+
+    def __init__(self, guild, extractor, audio_cache=None, channel=None, volume=DEFAULT_VOLUME / 100):
+        self.guild = guild
+        self.extractor = extractor
+        self.audio_cache = audio_cache
+        self.loop = asyncio.get_running_loop()
+        self.queue = deque()
+        # "off" / "track" / "queue"
+        self.loop_mode = "off"
+        self.volume = volume
+        # 再生中の通知先
+        self.channel = channel
+        # 再生中 (解決中を含む) の Track と、そのソースの情報
+        self.current = None
+        self.info = None
+        self.started = 0.0
+        self.offset = 0.0
+        # 読み込み中のプレイリスト
+        self.import_task = None
+        self._wake = asyncio.Event()
+        self._ended = asyncio.Event()
+        # None (最後まで再生) / "skip" / "stop" / "error"
+        self._end_reason = None
+        self._task = asyncio.create_task(self._run())
+
+    @property
+    def is_active(self):
+        return self.current is not None or bool(self.queue)
+
+    @property
+    def position(self):
+        """再生位置 (秒)"""
+        if self.info is None:
+            return 0.0
+        return self.offset + time.monotonic() - self.started
+
+    def enqueue(self, tracks):
+        self.queue.extend(tracks)
+        self._wake.set()
+
+    def shuffle(self):
+        tracks = list(self.queue)
+        random.shuffle(tracks)
+        self.queue.clear()
+        self.queue.extend(tracks)
+
+    def skip(self):
+        vc = self.guild.voice_client
+        if self.info is None or not vc or not (vc.is_playing() or vc.is_paused()):
+            return False
+        self._end_reason = "skip"
+        vc.stop()
+        return True
+
+    def stop(self):
+        """キューを空にして再生を止める (ボイスチャンネルには残る)"""
+        self.cancel_import()
+        self.queue.clear()
+        if self.info is None:
+            # 解決中の曲は再生させない
+            self.current = None
+        vc = self.guild.voice_client
+        if vc and (vc.is_playing() or vc.is_paused()):
+            self._end_reason = "stop"
+            vc.stop()
+
+    def cancel_import(self):
+        if self.import_task is not None:
+            self.import_task.cancel()
+            self.import_task = None
+
+    def restart(self, position=None):
+        """再生中の曲のソースを position 秒 (省略時は現在位置) から作り直す"""
+        vc = self.guild.voice_client
+        if self.info is None or not vc or not (vc.is_playing() or vc.is_paused()):
+            return False
+        position = self.position if position is None else max(0.0, position)
+        old = vc.source
+        # 差し替えても after コールバックは元のまま (曲送りは起きない)
+        vc.source = create_source(self.info, self.volume, position)
+        self.started, self.offset = time.monotonic(), position
+        old.cleanup()
+        return True
+
+    def set_volume(self, volume):
+        self.volume = volume
+        vc = self.guild.voice_client
+        if not MUSIC_OPUS:
+            if vc and vc.source:
+                vc.source.volume = volume
+        else:
+            # Opus モードはサンプル単位で変えられないので、現在位置から ffmpeg を起動し直す
+            self.restart()
+
+    def close(self):
+        self.stop()
+        self._task.cancel()
+
+    def _after(self, error):
+        # 音声スレッドから呼ばれる
+        if error:
+            print(f"Player error: {error}")
+        self.loop.call_soon_threadsafe(self._on_end, error is not None)
+
+    def _on_end(self, failed):
+        if failed and self._end_reason is None:
+            self._end_reason = "error"
+        self._ended.set()
+
+    async def _run(self):
+        idle = True
+        while True:
+            if not self.queue:
+                idle = True
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+
+            track = self.current = self.queue.popleft()
+            try:
+                played = await self._play(track, notify=not idle)
+            except Exception as e:
+                print(f"⚠️ 再生エラー ({self.guild.name}): {e}")
+                played = False
+            finally:
+                self.current = self.info = None
+            idle = False
+
+            if played:
+                reason, self._end_reason = self._end_reason, None
+                if self.loop_mode == "track" and reason is None:
+                    self.queue.appendleft(track)
+                elif self.loop_mode == "queue" and reason in (None, "skip"):
+                    self.queue.append(track)
+
+    async def _play(self, track, notify):
+        info = await self._resolve(track)
+        if info is None or self.current is not track:
+            return False
+        vc = self.guild.voice_client
+        if not vc or not vc.is_connected():
+            self.queue.clear()
+            return False
+
+        self._ended.clear()
+        self._end_reason = None
+        vc.play(create_source(info, self.volume), after=self._after)
+        self.info, self.started, self.offset = info, time.monotonic(), 0.0
+        print(f"🎵 Now playing in {self.guild.name}: {track.title}")
+
+        if self.audio_cache is not None and not info.get('local'):
+            # 初回再生と並行して保存しておく
+            self.audio_cache.fill(info)
+        if self.queue:
+            self._prefetch(self.queue[0])
+        # 曲が自動で切り替わったときだけ通知する (最初の曲はコマンドの返信で伝わる)
+        if notify:
+            await self._notify()
+
+        await self._ended.wait()
+        return True
+
+    async def _resolve(self, track):
+        path = self.audio_cache.lookup(track.cache_key) if self.audio_cache is not None else None
+        if path is not None:
+            # ディスクキャッシュにあればネットワークも変換も使わずにファイルを流す
+            return {'url': path, 'acodec': 'opus', 'ext': 'opus', 'local': True}
+        try:
+            return await self.extractor.extract(track.query)
+        except Exception as e:
+            print(f"⚠️ 曲の解決に失敗 ({track.title}): {e}")
+            return None
+
+    def _prefetch(self, track):
+        """次の曲のURLを先に解決してキャッシュに載せておく (曲間の待ち時間をなくす)"""
+        if self.audio_cache is not None and track.cache_key in self.audio_cache:
+            return
+        task = asyncio.create_task(self.extractor.extract(track.query))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def now_playing_embed(self, title="🎵 再生中"):
+        track = self.current
+        embed = discord.Embed(title=title, description=f"**[{track.title}]({track.query})**", color=COLOR_MAIN)
+        if self.info is not None:
+            embed.add_field(name="位置", value=f"{format_duration(self.position)} / {format_duration(track.duration)}")
+        if track.requester_id:
+            embed.add_field(name="リクエスト", value=f"<@{track.requester_id}>")
+        embed.set_footer(text=f"ループ: {LOOP_MODES[self.loop_mode]} | 次の曲: {len(self.queue)}曲")
+        return embed
+
+    async def _notify(self):
+        if self.channel is None:
+            return
+        try:
+            await self.channel.send(embed=self.now_playing_embed(), allowed_mentions=discord.AllowedMentions.none())
+        except discord.HTTPException as e:
+            print(f"⚠️ 再生通知に失敗 ({self.guild.name}): {e}")
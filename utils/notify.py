@@ -0,0 +1,69 @@
+import asyncio
+import asyncpg
+
+
+class NotifyListener:
+    """DBトリガーからの NOTIFY (payload = guild_id) を受け取り、チャンネルごとのコールバックを呼ぶ
+
+    プールとは別の専用接続1本で全チャンネルを LISTEN します。
+    切断されたら再接続し、取りこぼし対策として各購読者の on_reconnect を呼びます。
+    """
+
+    def __init__(self, db_url, enabled=True, own_pids=()):
+        self.db_url = db_url
+        self.enabled = enabled
+        # このプロセスのプール接続のサーバーPID (ignore_own で自分の変更を無視するため)
+        self.own_pids = own_pids
+        # {channel: (on_change(guild_id), on_reconnect(), ignore_own)}
+        self.handlers = {}
+        self._conn = None
+        self._task = None
+
+    def subscribe(self, channel, on_change, on_reconnect=None, ignore_own=False):
+        """ignore_own=True なら自プロセスの接続が起こした変更の通知は呼ばない (自分で反映済みの場合)"""
+        self.handlers[channel] = (on_change, on_reconnect, ignore_own)
+
+    def start(self):
+        if self.enabled and self.handlers and self._task is None:
+            self._task = asyncio.create_task(self._listen_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._conn is not None and not self._conn.is_closed():
+            await self._conn.close()
+
+    async def _listen_loop(self):
+        first = True
+        while True:
+            try:
+                self._conn = await asyncpg.connect(self.db_url)
+                closed = asyncio.Event()
+                self._conn.add_termination_listener(lambda conn: closed.set())
+                for channel in self.handlers:
+                    await self._conn.add_listener(channel, self._on_notify)
+                if not first:
+                    # 切断中の変更を取りこぼしているかもしれないので読み直す
+                    for _, on_reconnect, _ in self.handlers.values():
+                        if on_reconnect is not None:
+                            await on_reconnect()
+                first = False
+                await closed.wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ LISTEN エラー: {e}")
+            await asyncio.sleep(5)
+
+    def _on_notify(self, conn, pid, channel, payload):
+        on_change, _, ignore_own = self.handlers[channel]
+        if ignore_own and pid in self.own_pids:
+            return
+        asyncio.create_task(self._call_safe(channel, on_change, int(payload)))
+
+    async def _call_safe(self, channel, on_change, guild_id):
+        try:
+            await on_change(guild_id)
+        except Exception as e:
+            print(f"⚠️ {channel} の再読み込みエラー: {e}")
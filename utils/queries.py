@@ -0,0 +1,171 @@
+# --- 名前付きクエリ一覧 ---
+# Database.execute / fetch / fetchrow に名前を渡すと、ここに登録されたSQLを実行します
+# (prepare は asyncpg の接続ごとのステートメントキャッシュが1度だけ行います)。
+# SQLをコグに直接書かずここへ追加してください。
+
+QUERIES = {
+    # --- users (経済) ---
+    "users.get": "SELECT * FROM users WHERE user_id = $1",
+    "users.create": "INSERT INTO users (user_id) VALUES ($1) ON CONFLICT (user_id) DO NOTHING RETURNING user_id",
+    "users.add_money": """
+        INSERT INTO users (user_id, cash, bank, debt) VALUES ($1, $2, $3, $4)
+        ON CONFLICT (user_id) DO UPDATE
+        SET cash = users.cash + $2,
+            bank = users.bank + $3,
+            debt = users.debt + $4
+    """,
+    "users.add_money_batch": """
+        INSERT INTO users (user_id, cash, bank, debt)
+        SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::bigint[], $4::bigint[])
+        ON CONFLICT (user_id) DO UPDATE
+        SET cash = users.cash + EXCLUDED.cash,
+            bank = users.bank + EXCLUDED.bank,
+            debt = users.debt + EXCLUDED.debt
+    """,
+
+    # 条件付き更新: $1=user_id, $2〜$4=キャッシュ上の未反映差分 (cash, bank, debt), $5以降=引数
+    "users.update_money_if": """
+        UPDATE users
+        SET cash = cash + $2 + $5, bank = bank + $3 + $6, debt = debt + $4 + $7
+        WHERE user_id = $1
+          AND cash + $2 >= $8
+          AND ($9::bigint IS NULL OR debt + $4 + $7 <= $9)
+        RETURNING *
+    """,
+    "users.repay_debt": """
+        UPDATE users AS u
+        SET cash = u.cash + $2 - p.paid, bank = u.bank + $3, debt = u.debt + $4 - p.paid
+        FROM (SELECT LEAST($5::bigint, debt + $4) AS paid FROM users WHERE user_id = $1 FOR UPDATE) AS p
+        WHERE u.user_id = $1 AND p.paid > 0 AND u.cash + $2 >= $5
+        RETURNING u.*, p.paid
+    """,
+    "users.change_job": """
+        UPDATE users
+        SET cash = cash + $2 - $6, bank = bank + $3, debt = debt + $4, job = $5
+        WHERE user_id = $1 AND cash + $2 >= $6
+        RETURNING *
+    """,
+    "users.transfer": """
+        WITH sender AS (
+            UPDATE users
+            SET cash = cash + $2 - $6, bank = bank + $3, debt = debt + $4
+            WHERE user_id = $1 AND cash + $2 >= $6
+            RETURNING *
+        ), receiver AS (
+            INSERT INTO users (user_id, cash)
+            SELECT $5::bigint, $6::bigint FROM sender
+            ON CONFLICT (user_id) DO UPDATE SET cash = users.cash + EXCLUDED.cash
+        )
+        SELECT * FROM sender
+    """,
+    # idx_users_net_worth と同じ式で並べること (インデックススキャンになる)
+    "users.top_net_worth": """
+        SELECT user_id, (cash + bank - debt) as net_worth
+        FROM users
+        ORDER BY (cash + bank - debt) DESC, user_id
+        LIMIT $1 OFFSET $2
+    """,
+
+    # --- economy_ledger (経済台帳) ---
+    "ledger.history": """
+        SELECT * FROM economy_ledger
+        WHERE user_id = $1 AND ($2::bigint IS NULL OR id < $2)
+        ORDER BY id DESC
+        LIMIT $3
+    """,
+    "ledger.totals_by_source": """
+        SELECT source, COUNT(*) AS events, SUM(cash) AS cash, SUM(bank) AS bank, SUM(debt) AS debt
+        FROM economy_ledger
+        WHERE created_at >= $1
+        GROUP BY source
+        ORDER BY source
+    """,
+
+    # --- guild_settings (モデレーション) ---
+    # 書き込み系は RETURNING * の結果でキャッシュ (GuildSettingsCache) を更新する
+    "guild_settings.all": "SELECT * FROM guild_settings",
+    "guild_settings.get": "SELECT * FROM guild_settings WHERE guild_id = $1",
+    "guild_settings.set_log_channel": """
+        INSERT INTO guild_settings (guild_id, log_channel_id) VALUES ($1, $2)
+        ON CONFLICT (guild_id) DO UPDATE SET log_channel_id = $2
+        RETURNING *
+    """,
+    "guild_settings.set_bad_words": """
+        INSERT INTO guild_settings (guild_id, bad_words, automod_enabled) VALUES ($1, $2, $3)
+        ON CONFLICT (guild_id) DO UPDATE SET bad_words = $2, automod_enabled = $3
+        RETURNING *
+    """,
+    "guild_settings.set_spam_filter": """
+        INSERT INTO guild_settings (guild_id, spam_filter_enabled) VALUES ($1, $2)
+        ON CONFLICT (guild_id) DO UPDATE SET spam_filter_enabled = $2
+        RETURNING *
+    """,
+
+    # --- automod_config (AutoMod詳細設定) ---
+    # 書き込み系は RETURNING * の結果でキャッシュ (AutomodConfigCache) を更新する
+    "automod_config.all": "SELECT * FROM automod_config",
+    "automod_config.get": "SELECT * FROM automod_config WHERE guild_id = $1",
+    # NULL の項目は変更しない。閾値が NULL の行は環境変数の既定値 (SPAM_LIMIT / SPAM_MUTE_SECONDS) を使う
+    "automod_config.set_limits": """
+        INSERT INTO automod_config (guild_id, spam_threshold, mute_duration)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (guild_id) DO UPDATE
+        SET spam_threshold = COALESCE($2, automod_config.spam_threshold),
+            mute_duration = COALESCE($3, automod_config.mute_duration)
+        RETURNING *
+    """,
+    "automod_config.set_ignored": """
+        INSERT INTO automod_config (guild_id, spam_threshold, mute_duration, ignored_channels, ignored_roles)
+        VALUES ($1, NULL, NULL, $2, $3)
+        ON CONFLICT (guild_id) DO UPDATE SET ignored_channels = $2, ignored_roles = $3
+        RETURNING *
+    """,
+
+    # --- auto_responses (自動応答) ---
+    "auto_responses.by_guild": "SELECT * FROM auto_responses WHERE guild_id = $1 ORDER BY id",
+    "auto_responses.add": """
+        INSERT INTO auto_responses (guild_id, trigger, response, match_type, creator_id)
+        VALUES ($1, $2, $3, $4, $5)
+        RETURNING *
+    """,
+    "auto_responses.delete": "DELETE FROM auto_responses WHERE guild_id = $1 AND id = $2 RETURNING id",
+
+    # --- warnings (警告) ---
+    # idx_warnings_guild_user (guild_id, user_id, id) を逆順にたどるキーセットページング
+    "warnings.page": """
+        SELECT * FROM warnings
+        WHERE guild_id = $1 AND user_id = $2 AND ($3::bigint IS NULL OR id < $3)
+        ORDER BY id DESC
+        LIMIT $4
+    """,
+    "warnings.counts": "SELECT user_id, COUNT(*) AS count FROM warnings WHERE guild_id = $1 GROUP BY user_id",
+    "warnings.add": """
+        INSERT INTO warnings (guild_id, user_id, reason, moderator_id) VALUES ($1, $2, $3, $4)
+        RETURNING *
+    """,
+    "warnings.clear": "DELETE FROM warnings WHERE guild_id = $1 AND user_id = $2",
+
+    # --- raid_lockdowns (ロックダウン中のサーバー) ---
+    "raid_lockdowns.all": "SELECT * FROM raid_lockdowns",
+    # 既に行があれば (再開前に再度ロックダウンした等) 保存済みの元の認証レベルを残す
+    "raid_lockdowns.set": """
+        INSERT INTO raid_lockdowns (guild_id, previous_level, release_at) VALUES ($1, $2, $3)
+        ON CONFLICT (guild_id) DO UPDATE SET release_at = $3
+        RETURNING previous_level
+    """,
+    "raid_lockdowns.delete": "DELETE FROM raid_lockdowns WHERE guild_id = $1",
+}
+
+# --- クールダウン (utils/cooldowns.py) ---
+# 列名はSQLに埋め込むため、この一覧にあるものだけ登録する
+COOLDOWN_COLUMNS = ("last_daily", "last_work", "last_rob")
+for _column in COOLDOWN_COLUMNS:
+    QUERIES[f"cooldowns.load.{_column}"] = f"SELECT user_id, {_column} AS used_at FROM users WHERE {_column} > $1"
+    QUERIES[f"cooldowns.get.{_column}"] = f"SELECT {_column} AS used_at FROM users WHERE user_id = $1"
+    # $2=現在時刻, $3=これより前の使用ならクールダウン明け。他のプロセスが先に使っていれば行を返さない
+    QUERIES[f"cooldowns.claim.{_column}"] = f"""
+        INSERT INTO users (user_id, {_column}) VALUES ($1, $2)
+        ON CONFLICT (user_id) DO UPDATE SET {_column} = $2
+        WHERE users.{_column} IS NULL OR users.{_column} <= $3
+        RETURNING user_id
+    """
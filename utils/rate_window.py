@@ -0,0 +1,57 @@
+import sys
+import time
+from array import array
+
+
+class RateWindow:
+    """キーごとのスライディングウィンドウ (連投検知用)
+
+    各キーは直近 limit 件のタイムスタンプだけを array('d') で保持します。
+    辞書は最終発言順に並べ、idle_ttl 秒発言のないキーを先頭から捨てるため、
+    通過したユーザー数に関係なくメモリは「直近 idle_ttl 秒に発言した人数」分で頭打ちになります。
+    """
+
+    def __init__(self, idle_ttl=60.0, max_keys=100000):
+        # idle_ttl は使用する最大の window 以上にすること
+        self.idle_ttl = idle_ttl
+        self.max_keys = max_keys
+        self.keys = {}
+        self.evicted = 0
+
+    def hit(self, key, limit, window, now=None):
+        """1件記録し、直近 window 秒の件数 (最大 limit) を返す"""
+        now = time.monotonic() if now is None else now
+        stamps = self.keys.pop(key, None)
+        if stamps is None:
+            stamps = array('d')
+        else:
+            cut = 0
+            while cut < len(stamps) and now - stamps[cut] >= window:
+                cut += 1
+            if cut:
+                del stamps[:cut]
+        stamps.append(now)
+        if len(stamps) > limit:
+            del stamps[:len(stamps) - limit]
+        # 末尾へ入れ直す (先頭ほど長く発言していないキー)
+        self.keys[key] = stamps
+        self._evict(now)
+        return len(stamps)
+
+    def clear(self, key):
+        self.keys.pop(key, None)
+
+    def _evict(self, now):
+        keys = self.keys
+        while keys:
+            key = next(iter(keys))
+            if len(keys) <= self.max_keys and now - keys[key][-1] < self.idle_ttl:
+                break
+            del keys[key]
+            self.evicted += 1
+
+    def memory_usage(self):
+        """保持しているキー数・タイムスタンプ数と概算バイト数"""
+        stamps = sum(len(a) for a in self.keys.values())
+        size = sys.getsizeof(self.keys) + sum(sys.getsizeof(k) + sys.getsizeof(a) for k, a in self.keys.items())
+        return {"keys": len(self.keys), "timestamps": stamps, "bytes": size, "evicted": self.evicted}
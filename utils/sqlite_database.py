@@ -0,0 +1,301 @@
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from utils.database import Database
+from utils.ledger import Ledger
+from utils.migrations import migrate_sqlite
+from utils.queries import QUERIES
+
+
+@lru_cache(maxsize=512)
+def to_sqlite(sql):
+    """PostgreSQL 向けのSQLを SQLite 用に変換 ($1 → ?1, ::bigint などの型キャストを除去)"""
+    sql = re.sub(r"\$(\d+)", r"?\1", sql)
+    return re.sub(r"::\w+", "", sql)
+
+
+# --- SQLite で1文に書けないクエリ (writer スレッド内・1トランザクションで実行される) ---
+
+def _add_money_batch(conn, user_ids, cash, bank, debt):
+    conn.executemany(SQLITE_QUERIES["users.add_money"], zip(user_ids, cash, bank, debt))
+
+
+def _repay_debt(conn, user_id, p_cash, p_bank, p_debt, amount):
+    row = conn.execute("SELECT debt FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    if row is None:
+        return None
+    paid = min(amount, row['debt'] + p_debt)
+    rows = conn.execute("""
+        UPDATE users
+        SET cash = cash + ?2 - ?5, bank = bank + ?3, debt = debt + ?4 - ?5
+        WHERE user_id = ?1 AND ?5 > 0 AND cash + ?2 >= ?6
+        RETURNING *
+    """, (user_id, p_cash, p_bank, p_debt, paid, amount)).fetchall()
+    return {**dict(rows[0]), "paid": paid} if rows else None
+
+
+def _transfer(conn, from_id, p_cash, p_bank, p_debt, to_id, amount):
+    rows = conn.execute("""
+        UPDATE users
+        SET cash = cash + ?2 - ?5, bank = bank + ?3, debt = debt + ?4
+        WHERE user_id = ?1 AND cash + ?2 >= ?5
+        RETURNING *
+    """, (from_id, p_cash, p_bank, p_debt, amount)).fetchall()
+    if not rows:
+        return None
+    conn.execute("""
+        INSERT INTO users (user_id, cash) VALUES (?1, ?2)
+        ON CONFLICT (user_id) DO UPDATE SET cash = users.cash + excluded.cash
+    """, (to_id, amount))
+    return dict(rows[0])
+
+
+def _insert_ledger(conn, records):
+    columns = ", ".join(Ledger.COLUMNS)
+    placeholders = ", ".join("?" for _ in Ledger.COLUMNS)
+    conn.executemany(f"INSERT INTO economy_ledger ({columns}) VALUES ({placeholders})", records)
+
+
+def _fetch_user_if(conn, query, user_id, *args):
+    row = _run_query(conn, "fetchrow", query, (user_id,) + args)
+    if row is None and _run_query(conn, "fetchrow", "users.create", (user_id,)):
+        row = _run_query(conn, "fetchrow", query, (user_id,) + args)
+    return row
+
+
+SQLITE_QUERIES = {name: to_sqlite(sql) for name, sql in QUERIES.items()}
+SQLITE_QUERIES.update({
+    "users.add_money_batch": _add_money_batch,
+    "users.repay_debt": _repay_debt,
+    "users.transfer": _transfer,
+})
+
+
+def _resolve(query):
+    """クエリ名・関数・生のSQL のいずれかを SQLite で実行できる形にする"""
+    if callable(query):
+        return query
+    if query in SQLITE_QUERIES:
+        return SQLITE_QUERIES[query]
+    return to_sqlite(query)
+
+
+def _run_query(conn, kind, query, args):
+    sql = _resolve(query)
+    if callable(sql):
+        return sql(conn, *args)
+    cur = conn.execute(sql, args)
+    rows = cur.fetchall()
+    if kind == "fetch":
+        return [dict(row) for row in rows]
+    if kind == "fetchrow":
+        return dict(rows[0]) if rows else None
+    return f"OK {cur.rowcount}"
+
+
+class SQLiteDatabase(Database):
+    """組み込み SQLite バックエンド (DATABASE_URL=sqlite:///rumia.db)
+
+    WAL モードで、読み込みは複数のリーダースレッド、書き込みは writer タスク1本に集約します。
+    キューに溜まった書き込みは1トランザクションにまとめてコミットします (1件ごとに SAVEPOINT)。
+    get_user / update_money / execute / fetch / fetchrow などの使い方は Database と同じです。
+    """
+
+    def __init__(self, db_url):
+        super().__init__(db_url)
+        # sqlite:///rumia.db → rumia.db / sqlite:////data/rumia.db → /data/rumia.db
+        self.path = db_url.split(":///", 1)[1] if ":///" in db_url else db_url.split("://", 1)[1]
+        self.batch_size = int(os.getenv("SQLITE_BATCH_SIZE", 100))
+        self.reader_count = int(os.getenv("SQLITE_READERS", 2))
+        # 単一プロセス前提のため NOTIFY の受信は行わない
+        self.notify.enabled = False
+
+        self._writer_conn = None
+        self._write_queue = None
+        self._writer_task = None
+        self._write_executor = None
+        self._read_executor = None
+        self._local = threading.local()
+        self._readers = []
+        self._batches = 0
+        self._batched_ops = 0
+
+    async def connect(self):
+        try:
+            self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+            self._read_executor = ThreadPoolExecutor(max_workers=self.reader_count, thread_name_prefix="sqlite-reader")
+            loop = asyncio.get_running_loop()
+            self._writer_conn = await loop.run_in_executor(self._write_executor, self._open)
+            await self.initialize_tables()
+
+            self._write_queue = asyncio.Queue()
+            self._writer_task = asyncio.create_task(self._writer_loop())
+            await self.guild_settings.start()
+            await self.automod_config.start()
+            self.auto_responses.start()
+            self.warnings.start()
+            await self.cooldowns.start()
+            self.ledger.start()
+            if self.balances:
+                self.balances.start()
+            print(f"✅ データベース接続成功 (SQLite: {self.path})")
+        except Exception as e:
+            print(f"❌ データベース接続エラー: {e}")
+            raise e
+
+    async def close(self):
+        await self.notify.stop()
+        await self.cooldowns.close()
+        try:
+            await self.ledger.close()
+        except Exception as e:
+            print(f"❌ 台帳の書き込みエラー: {e}")
+        if self.balances:
+            try:
+                await self.balances.close()
+            except Exception as e:
+                print(f"❌ 残高の書き戻しエラー: {e}")
+        if self._writer_task is not None:
+            # キューに残っている書き込みを処理し終えてから止める
+            await self._write_queue.put(None)
+            await self._writer_task
+            self._writer_task = None
+        for conn in [self._writer_conn, *self._readers]:
+            if conn is not None:
+                conn.close()
+        for executor in (self._write_executor, self._read_executor):
+            if executor is not None:
+                executor.shutdown(wait=False)
+
+    async def initialize_tables(self):
+        """スキーマを最新化。適用済みならDDLは実行しません (utils/migrations.py)"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._write_executor, migrate_sqlite, self._writer_conn)
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self.pool_options["statement_cache_size"],
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def pool_stats(self):
+        return {
+            "backend": "sqlite",
+            "readers": self.reader_count,
+            "write_queue": self._write_queue.qsize() if self._write_queue else 0,
+            "write_batches": self._batches,
+            "avg_batch_size": round(self._batched_ops / self._batches, 2) if self._batches else 0.0,
+        }
+
+    # --- 読み込み (リーダースレッド) ---
+
+    def _read_sync(self, kind, query, args):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._open()
+            self._readers.append(conn)
+        return _run_query(conn, kind, query, args)
+
+    # --- 書き込み (writer タスク) ---
+
+    async def _writer_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            op = await self._write_queue.get()
+            if op is None:
+                return
+            ops = [op]
+            stop = False
+            while len(ops) < self.batch_size and not self._write_queue.empty():
+                op = self._write_queue.get_nowait()
+                if op is None:
+                    stop = True
+                    break
+                ops.append(op)
+
+            batch = [(kind, query, args) for kind, query, args, _ in ops]
+            try:
+                results = await loop.run_in_executor(self._write_executor, self._commit_batch, batch)
+            except Exception as e:
+                results = [(False, e)] * len(ops)
+            self._batches += 1
+            self._batched_ops += len(ops)
+
+            for (_, _, _, future), (ok, value) in zip(ops, results):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+            if stop:
+                return
+
+    def _commit_batch(self, batch):
+        conn = self._writer_conn
+        results = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for kind, query, args in batch:
+                # 1件の失敗でまとめた他の書き込みを巻き込まないよう SAVEPOINT で区切る
+                conn.execute("SAVEPOINT op")
+                try:
+                    results.append((True, _run_query(conn, kind, query, args)))
+                    conn.execute("RELEASE op")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO op")
+                    conn.execute("RELEASE op")
+                    results.append((False, e))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return results
+
+    async def _dispatch(self, kind, query, args):
+        sql = _resolve(query)
+        if not callable(sql) and sql.lstrip().upper().startswith("SELECT"):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._read_executor, self._read_sync, kind, query, args)
+
+        future = asyncio.get_running_loop().create_future()
+        self._write_queue.put_nowait((kind, query, args, future))
+        return await future
+
+    # --- Database と同じ公開メソッド ---
+
+    async def execute(self, query, *args):
+        return await self._dispatch("execute", query, args)
+
+    async def fetch(self, query, *args):
+        return await self._dispatch("fetch", query, args)
+
+    async def fetchrow(self, query, *args):
+        return await self._dispatch("fetchrow", query, args)
+
+    async def _load_user(self, user_id):
+        row = await self.fetchrow("users.get", user_id)
+        if not row:
+            await self.fetchrow("users.create", user_id)
+            return {"user_id": user_id, "cash": 0, "bank": 0, "debt": 0, "job": "ニート", "xp": 0, "level": 1}
+        return row
+
+    async def _fetch_user_if(self, query, user_id, *args):
+        return await self._dispatch("fetchrow", _fetch_user_if, (query, user_id) + args)
+
+    async def copy_ledger(self, records):
+        # SQLite には COPY が無いので writer のトランザクション内で executemany
+        await self._dispatch("execute", _insert_ledger, (records,))
@@ -0,0 +1,72 @@
+import asyncio
+
+
+class WarningStore:
+    """警告の読み書きと、ユーザーごとの警告数キャッシュ
+
+    警告数はサーバーごとに初回だけ GROUP BY で読み込み、以降は add/clear で増減させるため、
+    on_message 内のエスカレーション判定で COUNT クエリは発生しません。
+    履歴は (guild_id, user_id, id) のインデックスに沿ったキーセットページングで取得します。
+    """
+
+    CHANNEL = "warnings_changed"
+
+    def __init__(self, db):
+        self.db = db
+        # {guild_id: {user_id: 件数}}
+        self.counts = {}
+        self._loading = {}
+
+    async def _guild_counts(self, guild_id):
+        counts = self.counts.get(guild_id)
+        if counts is not None:
+            return counts
+        task = self._loading.get(guild_id)
+        if task is None:
+            task = self._loading[guild_id] = asyncio.create_task(self._load(guild_id))
+        return await asyncio.shield(task)
+
+    async def _load(self, guild_id):
+        try:
+            rows = await self.db.fetch("warnings.counts", guild_id)
+            counts = {row['user_id']: row['count'] for row in rows}
+            if self._loading.get(guild_id) is asyncio.current_task():
+                self.counts[guild_id] = counts
+            return counts
+        finally:
+            if self._loading.get(guild_id) is asyncio.current_task():
+                del self._loading[guild_id]
+
+    async def count(self, guild_id, user_id):
+        return (await self._guild_counts(guild_id)).get(user_id, 0)
+
+    async def add(self, guild_id, user_id, reason, moderator_id):
+        """警告を追加し、(追加した行, 追加後の件数) を返す"""
+        counts = await self._guild_counts(guild_id)
+        row = await self.db.fetchrow("warnings.add", guild_id, user_id, reason, moderator_id)
+        counts[user_id] = counts.get(user_id, 0) + 1
+        return row, counts[user_id]
+
+    async def clear(self, guild_id, user_id):
+        """ユーザーの警告を全て削除し、削除件数を返す"""
+        status = await self.db.execute("warnings.clear", guild_id, user_id)
+        counts = self.counts.get(guild_id)
+        if counts is not None:
+            counts.pop(user_id, None)
+        return int(status.split()[-1])
+
+    async def page(self, guild_id, user_id, before_id=None, limit=10):
+        """新しい順に limit 件。before_id より古いものを返す (キーセットページング)"""
+        return await self.db.fetch("warnings.page", guild_id, user_id, before_id, limit)
+
+    async def invalidate(self, guild_id):
+        self.counts.pop(guild_id, None)
+        self._loading.pop(guild_id, None)
+
+    async def invalidate_all(self):
+        self.counts.clear()
+        self._loading.clear()
+
+    def start(self):
+        # 自プロセスの add/clear は件数を直接増減済みなので、その通知では捨てない
+        self.db.notify.subscribe(self.CHANNEL, self.invalidate, self.invalidate_all, ignore_own=True)
@@ -0,0 +1,86 @@
+import os
+import unicodedata
+from collections import deque
+from functools import lru_cache
+
+# 禁止用語の表記ゆれ吸収 (BAD_WORDS_NORMALIZE=0 で無効化し、完全一致のみ)
+NORMALIZE = os.getenv("BAD_WORDS_NORMALIZE", "1") != "0"
+
+# カタカナ → ひらがな (ァ〜ヶ は ぁ〜ゖ の 0x60 後ろ)
+_KANA_FOLD = {c: c - 0x60 for c in range(0x30A1, 0x30F7)}
+
+
+def normalize(text):
+    """NFKC (全角英数・半角カナの統一) + 大文字小文字 + カタカナ→ひらがな"""
+    return unicodedata.normalize("NFKC", text).casefold().translate(_KANA_FOLD)
+
+
+class WordMatcher:
+    """複数の禁止用語を1回の走査で探す Aho–Corasick オートマトン
+
+    単語数に関係なく、メッセージ長に比例した時間で判定します。
+    """
+
+    __slots__ = ("normalize", "_goto", "_fail", "_out")
+
+    def __init__(self, words, normalize=True):
+        self.normalize = normalize
+        self._goto = [{}]
+        self._out = [None]
+        for word in words:
+            key = self._prepare(word.strip())
+            if not key:
+                continue
+            state = 0
+            for ch in key:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._out.append(None)
+                state = nxt
+            if self._out[state] is None:
+                self._out[state] = word.strip()
+
+        # 失敗リンクを幅優先で作成し、出力を失敗先から引き継ぐ
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                # 深さ1のノードは根へ戻る (根自身の遷移先が自分になるため)
+                self._fail[nxt] = self._goto[fail].get(ch, 0) if state else 0
+                if self._out[nxt] is None:
+                    self._out[nxt] = self._out[self._fail[nxt]]
+
+    def _prepare(self, text):
+        return normalize(text) if self.normalize else text
+
+    def __len__(self):
+        return len(self._goto) - 1
+
+    def find(self, text):
+        """最初に見つかった禁止用語を返す (なければ None)"""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for ch in self._prepare(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state] is not None:
+                return out[state]
+        return None
+
+
+@lru_cache(maxsize=1024)
+def compile_bad_words(bad_words, normalize=NORMALIZE):
+    """guild_settings.bad_words (カンマ区切り) をコンパイル
+
+    設定文字列をキーにキャッシュするため、設定が変わるまで再構築しません。
+    """
+    return WordMatcher(bad_words.split(","), normalize=normalize)
@@ -0,0 +1,226 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import parse_qs, urlparse
+
+import yt_dlp
+
+# --- yt-dlp 設定 (Cookie対応・エラー回避) ---
+YTDL_OPTS = {
+    'format': 'bestaudio/best',
+    'outtmpl': '%(extractor)s-%(id)s-%(title)s.%(ext)s',
+    'restrictfilenames': True,
+    'noplaylist': True,
+    'nocheckcertificate': True,
+    'ignoreerrors': False,
+    'logtostderr': False,
+    'quiet': True,
+    'no_warnings': True,
+    'default_search': 'auto',
+    'source_address': '0.0.0.0',
+    # ユーザーエージェント偽装 (Bot検知回避)
+    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+}
+
+# 抽出結果のうちプロセス間で受け渡す項目 (acodec / ext は Opus をそのまま流せるかの判定用)
+INFO_KEYS = ("url", "title", "duration", "webpage_url", "id", "extractor", "acodec", "ext")
+
+
+class ExtractionError(Exception):
+    """yt-dlp の抽出エラー (子プロセスから pickle で返せる形にしたもの)"""
+
+
+def ytdl_options():
+    # Cookieファイルが存在する場合のみ読み込む (main.pyで起動時に生成)
+    return {**YTDL_OPTS, 'cookiefile': 'cookies.txt' if os.path.exists('cookies.txt') else None}
+
+
+def _extract(query, opts):
+    """子プロセス側で実行。必要な項目だけに絞って返す"""
+    try:
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            info = ydl.extract_info(query, download=False)
+    except Exception as e:
+        raise ExtractionError(str(e)) from None
+    # プレイリスト・検索結果の場合は最初の動画
+    if 'entries' in info:
+        entries = [e for e in info['entries'] if e]
+        if not entries:
+            raise ExtractionError("見つかりませんでした")
+        info = entries[0]
+    return {key: info.get(key) for key in INFO_KEYS}
+
+
+def _extract_flat(url, start, end, opts):
+    """子プロセス側で実行。プレイリストの start〜end 件目を個別の解決なしで取得する
+
+    (取得件数, 曲情報のリスト) を返します。削除済みなどの空エントリも件数には含めます。
+    """
+    opts = {**opts, 'extract_flat': 'in_playlist', 'noplaylist': False, 'playlist_items': f"{start}-{end}"}
+    try:
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+    except Exception as e:
+        raise ExtractionError(str(e)) from None
+    raw = list(info.get('entries') or [])
+    entries = []
+    for entry in raw:
+        if not entry or not entry.get('url'):
+            continue
+        # url は動画ページ (ストリームURLは再生直前に解決する)
+        entries.append({
+            'url': entry['url'],
+            'webpage_url': entry['url'],
+            'title': entry.get('title'),
+            'duration': entry.get('duration'),
+            'id': entry.get('id'),
+            'extractor': (entry.get('ie_key') or '').lower() or None,
+        })
+    return len(raw), entries
+
+
+def is_playlist_url(query):
+    """プレイリストとして読み込むURLか (動画付きの watch?v=...&list=... は単曲扱い)"""
+    parsed = urlparse(query)
+    if parsed.scheme not in ("http", "https"):
+        return False
+    path = parsed.path.rstrip("/")
+    if path == "/playlist":
+        return "list" in parse_qs(parsed.query)
+    # SoundCloud のセット
+    return "/sets/" in f"{path}/"
+
+
+def _mp_context():
+    """子プロセスの起動方式 (fork は使わない)
+
+    プール作成時にはすでに SQLite リーダーや音声のスレッドが動いており、
+    スレッドを持つプロセスを fork すると子がロック待ちで固まることがあるため、
+    forkserver (使えない環境では spawn) で起動します。
+    どちらの方式でも main.py は子側で __mp_main__ として import し直されますが、
+    起動処理は if __name__ == "__main__": の中にあるため Bot は起動しません。
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        # 抽出に必要なモジュールをサーバー側で先読みしておく (子の起動を速くする)
+        ctx.set_forkserver_preload(["utils.ytdl"])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+def _url_expiry(url):
+    """署名付きURLの有効期限 (googlevideo の expire=) を UNIX 時刻で返す"""
+    try:
+        expire = parse_qs(urlparse(url).query).get("expire")
+        return float(expire[0]) if expire else None
+    except (ValueError, TypeError):
+        return None
+
+
+class Extractor:
+    """yt-dlp の抽出をプロセスプールで行うラッパー
+
+    イベントループを止めないよう別プロセスで実行し、同時実行数を concurrency に制限します。
+    結果はクエリごとに ttl 秒 (署名付きURLの期限より短く) キャッシュし、
+    同じクエリの同時リクエストは1回の抽出にまとめます。
+    """
+
+    def __init__(self, workers=2, concurrency=4, ttl=1800.0, max_entries=512):
+        self.workers = workers
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.semaphore = asyncio.Semaphore(concurrency)
+        # {query: (期限(monotonic), info)}
+        self.cache = OrderedDict()
+        # 抽出中 {query: Future}
+        self.inflight = {}
+        self._executor = None
+
+    async def extract(self, query):
+        """INFO_KEYS の項目だけを持つ dict を返す"""
+        cached = self.cache.get(query)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                self.cache.move_to_end(query)
+                return cached[1]
+            del self.cache[query]
+
+        future = self.inflight.get(query)
+        if future is None:
+            future = self.inflight[query] = asyncio.ensure_future(self._extract(query))
+            future.add_done_callback(lambda _: self.inflight.pop(query, None))
+        return await asyncio.shield(future)
+
+    async def _extract(self, query):
+        async with self.semaphore:
+            info = await self._run(_extract, query, ytdl_options())
+        self._store(query, info)
+        return info
+
+    async def playlist(self, url, limit, chunk_size=50):
+        """プレイリストを chunk_size 件ずつフラット抽出し、届いた分から yield する (最大 limit 件)
+
+        各曲のストリームURLは解決しないので、曲情報は Track.from_info にそのまま渡せます。
+        """
+        start = 1
+        while start <= limit:
+            end = min(start + chunk_size - 1, limit)
+            async with self.semaphore:
+                count, entries = await self._run(_extract_flat, url, start, end, ytdl_options())
+            if entries:
+                yield entries
+            if count < end - start + 1:
+                return
+            start = end + 1
+
+    async def _run(self, func, *args):
+        """プールで func を実行する
+
+        ワーカーが落ちる (OOM で kill される等) とプールは BrokenProcessPool で使えなくなるため、
+        作り直して1回だけ再試行します。
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            executor = self._pool()
+            try:
+                return await loop.run_in_executor(executor, func, *args)
+            except BrokenProcessPool:
+                # 同時に失敗した別の呼び出しがすでに作り直していればそちらを使う
+                if self._executor is executor:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    self._executor = None
+                if attempt:
+                    raise
+                print("⚠️ yt-dlp のワーカーが異常終了したためプロセスプールを作り直します")
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_mp_context())
+        return self._executor
+
+    def _store(self, query, info):
+        ttl = self.ttl
+        expiry = _url_expiry(info.get("url") or "")
+        if expiry is not None:
+            # 期限の1分前には使わないようにする
+            ttl = min(ttl, expiry - time.time() - 60)
+        if ttl <= 0:
+            return
+        # 再生直前の再解決は webpage_url で行うため、そちらのキーでも引けるようにする
+        for key in {query, info.get("webpage_url") or query}:
+            self.cache[key] = (time.monotonic() + ttl, info)
+            self.cache.move_to_end(key)
+        while len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+
+    def invalidate(self, query):
+        self.cache.pop(query, None)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None